@@ -1,26 +1,60 @@
 import os
 import io
+import re
 import csv
+import gzip
+import json
+import queue
+import time
+import zlib
+import signal
+import sqlite3
+import fcntl
 import atexit
+import hashlib
 import secrets
 import smtplib
 import logging
 import traceback
 import threading
+import sys
 import mysql.connector
 from flask_cors import CORS
-from datetime import datetime
-from mysql.connector import Error
+from functools import lru_cache
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from mysql.connector import Error, errorcode
 from email.mime.text import MIMEText
 from contextlib import contextmanager
 from email.mime.multipart import MIMEMultipart
-from flask import Flask, render_template, session, request, jsonify, Response, make_response, redirect, url_for
+from flask import Flask, render_template, session, request, jsonify, Response, make_response, redirect, url_for, stream_with_context, g, has_request_context
+from werkzeug.security import safe_join
 from apscheduler.schedulers.background import BackgroundScheduler
 
-app = Flask(__name__, template_folder='templates', static_folder='static')
-CORS(app, supports_credentials=True)
+# Optional: responses are brotli-compressed for clients that accept it when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Optional: faster encoder for the compact history format when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def running_on_gevent():
+    # True under gunicorn's gevent worker (see gunicorn.conf.py), which patches
+    # sockets, threads and queues before the app is imported
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
 
-app.secret_key = secrets.token_hex(32)
+app = Flask(__name__, template_folder='templates', static_folder='static')
+CORS(app, supports_credentials=True, expose_headers=['X-Next-Cursor', 'X-Change-Cursor', 'X-Delta-Truncated', 'ETag'])
 
 logging.basicConfig(level=logging.INFO)
 
@@ -33,15 +67,141 @@ def handle_exception(e):
         'details': str(e)
     }), 500
 
+# Set SECRET_KEY (or FLASK_SECRET_KEY, see create_app) when running more than
+# one worker; otherwise every process signs sessions with its own random key
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+
 app.config['MYSQL_HOST'] = ''
 app.config['MYSQL_USER'] = ''
 app.config['MYSQL_PASSWORD'] = ''
 app.config['MYSQL_DB'] = ''
 
+# IANA zone the naive DATETIME columns are written in (None: this host's zone);
+# JSON and SSE payloads carry timestamps as ISO 8601 with an explicit offset
+app.config['DB_TIMEZONE'] = os.environ.get('DB_TIMEZONE')
+
+# Connection pool tuning (see /db-pool-stats)
+app.config['MYSQL_POOL_SIZE'] = 10
+app.config['MYSQL_POOL_MAX_OVERFLOW'] = 10
+app.config['MYSQL_POOL_RECYCLE'] = 3600
+app.config['MYSQL_POOL_PRE_PING'] = True
+app.config['MYSQL_POOL_TIMEOUT'] = 30
+# Seconds to wait for a new MySQL connection; without it an unreachable server
+# holds each request for the OS TCP timeout before the guardhouse journal takes over
+app.config['MYSQL_CONNECT_TIMEOUT'] = 5
+# The C extension blocks the whole process on network I/O; the pure-Python
+# driver goes through the patched socket module and yields to other requests
+app.config['MYSQL_USE_PURE'] = running_on_gevent()
+
+# /checkout-history page size for HR views
+app.config['HISTORY_PAGE_SIZE'] = 100
+app.config['HISTORY_MAX_PAGE_SIZE'] = 500
+app.config['HISTORY_DELTA_OVERLAP_SECONDS'] = 5
+
+# /export streams this many rows per chunk
+app.config['EXPORT_CHUNK_ROWS'] = 1000
+
+# /events live feed. 'mysql' relays events between gunicorn workers through the
+# movement_event table; 'local' keeps them in-process (single worker / development)
+app.config['EVENTS_BACKEND'] = 'mysql'
+# Each open /events stream holds a worker for as long as the tab is open, which
+# only scales on gevent workers; elsewhere the pages fall back to delta polling
+app.config['EVENTS_STREAMING'] = running_on_gevent()
+app.config['EVENTS_POLL_INTERVAL'] = 1.0
+app.config['EVENTS_HEARTBEAT_SECONDS'] = 15
+app.config['EVENTS_HISTORY_SIZE'] = 1000
+app.config['EVENTS_SUBSCRIBER_QUEUE_SIZE'] = 1000
+app.config['EVENTS_RETENTION_MINUTES'] = 60
+
+# Employee directory cache (seconds); unknown numbers are cached for the negative TTL
+app.config['EMPLOYEE_CACHE_SIZE'] = 5000
+app.config['EMPLOYEE_CACHE_TTL'] = 300
+app.config['EMPLOYEE_CACHE_NEGATIVE_TTL'] = 30
+
+# Concurrent identical employee, session and checkout-status lookups share one
+# query (see /single-flight)
+app.config['SINGLE_FLIGHT_ENABLED'] = True
+
+# Upper bound (seconds) on how long a session index entry is trusted without a DB read
+app.config['SESSION_INDEX_TTL'] = 300
+
+# Background jobs. 'leader': every process competes for a lock and only the
+# holder runs the jobs; 'always': run them in this process regardless;
+# 'off': never run them here (see run_scheduler.py)
+app.config['SCHEDULER_MODE'] = os.environ.get('SCHEDULER_MODE', 'leader')
+app.config['SCHEDULER_LOCK_BACKEND'] = 'mysql'  # 'mysql' (GET_LOCK) or 'file' (single host)
+app.config['SCHEDULER_LOCK_NAME'] = 'employee_movement_scheduler'
+app.config['SCHEDULER_LOCK_FILE'] = '/tmp/employee_movement_scheduler.lock'
+app.config['SCHEDULER_LEADER_RETRY'] = 15
+
+# Maintenance jobs work in primary-key batches with a commit per batch so row
+# locks are held briefly; the pause (seconds) leaves room for live traffic
+app.config['MAINTENANCE_BATCH_SIZE'] = 1000
+app.config['MAINTENANCE_BATCH_PAUSE'] = 0.05
+
+# /analytics rollups; the nightly refresh rebuilds this many recent days from checkout
+app.config['ANALYTICS_REFRESH_DAYS'] = 7
+app.config['ANALYTICS_DEFAULT_DAYS'] = 30
+app.config['ANALYTICS_TOP_EMPLOYEES'] = 50
+# MySQL named lock that keeps check-ins from incrementing the rollup while a
+# rebuild recounts it; a check-in that waits longer than the timeout (seconds)
+# leaves its increment to the nightly refresh
+app.config['ANALYTICS_ROLLUP_LOCK'] = 'employee_movement_rollup'
+app.config['ANALYTICS_ROLLUP_LOCK_TIMEOUT'] = 5
+
+# Responses of these types are compressed when at least COMPRESS_MIN_SIZE bytes
+app.config['COMPRESS_MIMETYPES'] = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript')
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_LEVEL'] = 6
+
+# Opt-in request profiling: Server-Timing headers, a slow-request log with
+# EXPLAIN output, and the sampling profiler behind /profiler and SIGUSR2 (sync
+# workers only)
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING', '') == '1'
+app.config['SLOW_REQUEST_MS'] = 500
+app.config['SLOW_REQUEST_EXPLAIN'] = True
+app.config['SLOW_REQUEST_LOG'] = os.environ.get('SLOW_REQUEST_LOG')  # file path; default is the app log
+app.config['PROFILER_INTERVAL'] = 0.005
+app.config['PROFILER_OUTPUT_DIR'] = '/tmp'
+
+# Largest team accepted by /group-checkout and /group-checkin
+app.config['GROUP_MAX_SIZE'] = 100
+
+# Completed movements older than this many days move to checkout_archive
+app.config['ARCHIVE_AFTER_DAYS'] = 180
+
+# Guardhouse mode: gate confirmations and check-ins are written to a local
+# SQLite journal, acknowledged at once and replayed to MySQL in the background.
+# 'off'; 'fallback': journal only while MySQL is unreachable; 'journal': always
+app.config['GUARDHOUSE_MODE'] = os.environ.get('GUARDHOUSE_MODE', 'off')
+app.config['GUARDHOUSE_JOURNAL'] = os.environ.get('GUARDHOUSE_JOURNAL', 'guardhouse_journal.db')
+app.config['GUARDHOUSE_SYNC_INTERVAL'] = 2
+app.config['GUARDHOUSE_KEEP_SYNCED_HOURS'] = 24
+# How long a cached session can still be used for offline confirmations and check-ins
+app.config['GUARDHOUSE_SESSION_TTL'] = 86400
+
 EMAIL_ADDRESS = 'system@example.com'
 EMAIL_PASSWORD = 'system'
 SMTP_SERVER = 'mail.example.com'
 SMTP_PORT = 587
+SMTP_USE_TLS = True
+
+# Notification queue drained by NOTIFY_WORKERS long-lived SMTP sessions
+NOTIFY_WORKERS = 2
+NOTIFY_QUEUE_SIZE = 1000
+NOTIFY_MAX_RETRIES = 3
+NOTIFY_RETRY_BACKOFF = 2
+SMTP_IDLE_TIMEOUT = 60
+
+# Digest mode: non-critical notifications are batched per recipient set and
+# sent as one email every NOTIFY_DIGEST_WINDOW seconds. Batches are kept per
+# worker process, so each gunicorn worker sends its own digest per window; a
+# worker flushes its batches when it exits, but a killed one loses them
+NOTIFY_DIGEST_ENABLED = False
+NOTIFY_DIGEST_WINDOW = 300
+NOTIFY_DIGEST_MAX_EVENTS = 100
+NOTIFY_IMMEDIATE_DEPARTMENTS = []
+NOTIFY_CRITICAL_HOURS = 8
 
 DEPARTMENT_EMAIL_MAPPING = { 
     'HI': ['hi@example.com']
@@ -50,7 +210,171 @@ DEPARTMENT_EMAIL_MAPPING = {
 HR_NOTIFICATION_EMAIL = ['hr@example.com', 'hr2@example.com']
 OPERATION_MANAGER_EMAIL = ['mgr@example.com']
 
-def get_conn():
+# Latency histogram buckets (seconds) for /metrics
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRICS_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Time spent handling a request, by route'),
+    'http_requests_total': ('counter', 'Requests handled, by route and status code'),
+    'http_request_errors_total': ('counter', 'Requests that ended in a 5xx response, by route'),
+    'db_query_duration_seconds': ('histogram', 'Time spent in cursor.execute, by statement'),
+    'db_query_errors_total': ('counter', 'Statements that raised a MySQL error, by statement'),
+    'smtp_send_duration_seconds': ('histogram', 'Time to deliver one notification, including retries'),
+    'notification_queue_wait_seconds': ('histogram', 'Time a notification waited in the queue'),
+    'scheduler_job_duration_seconds': ('histogram', 'Duration of each maintenance job run'),
+    'scheduler_job_rows_total': ('counter', 'Rows affected by maintenance jobs'),
+    'analytics_rollup_errors_total': ('counter', 'Check-ins whose rollup write failed (repaired by the nightly refresh)'),
+}
+
+class Metrics:
+    # Per-process counters and histograms rendered in the Prometheus text format.
+    # Label sets are tuples of (name, value) pairs so they can be dict keys.
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # One slot per bucket plus +Inf, then sum
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(self.buckets)] += 1
+            hist[-1] += value
+
+    def render(self, gauges=()):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind, text):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), hist in histograms:
+            declare(name, *METRICS_HELP.get(name, ('histogram', name)))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), hist):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+        for (name, labels), value in counters:
+            declare(name, *METRICS_HELP.get(name, ('counter', name)))
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, kind, text, labels, value in gauges:
+            if value is None:
+                continue
+            declare(name, kind, text)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+metrics = Metrics(METRICS_BUCKETS)
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    # "SELECT checkout", "UPDATE checkout", ... keeps the label set small
+    match = re.match(r'\s*(\w+)', sql)
+    verb = match.group(1).upper() if match else 'UNKNOWN'
+    table = re.search(r'\b(?:FROM|INTO|UPDATE)\s+`?(\w+)', sql, re.IGNORECASE)
+    return f"{verb} {table.group(1)}" if table else verb
+
+@contextmanager
+def timed_phase(name):
+    # Adds the time spent in the block to the current request's Server-Timing
+    # phases; a no-op unless PROFILING_ENABLED
+    timings = g.get('timings') if has_request_context() else None
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + time.perf_counter() - started
+
+def record_statement(sql, params, elapsed):
+    timings = g.get('timings')
+    if timings is None:
+        return
+    timings['db'] = timings.get('db', 0) + elapsed
+    g.statement_count += 1
+    if len(g.statements) < 50:
+        g.statements.append((sql, params, elapsed))
+
+class TimedCursor:
+    # Thin proxy around a mysql.connector cursor that times every statement
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, method, sql, params):
+        labels = (('statement', statement_label(sql)),)
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        except Error:
+            metrics.inc('db_query_errors_total', labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('db_query_duration_seconds', labels, elapsed)
+            if has_request_context():
+                # executemany params are not kept; there is nothing useful to EXPLAIN
+                record_statement(sql, params if method == self._cursor.execute else None, elapsed)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._timed(self._cursor.executemany, sql, seq_params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def _connect():
     try:
         conn = mysql.connector.connect(
             host=app.config['MYSQL_HOST'],
@@ -58,10 +382,16 @@ def get_conn():
             password=app.config['MYSQL_PASSWORD'],
             database=app.config['MYSQL_DB'],
             charset='utf8mb4',
-            use_unicode=True
+            use_unicode=True,
+            connection_timeout=app.config['MYSQL_CONNECT_TIMEOUT'],
+            # Single-statement writes commit in the same round trip; multi-statement
+            # units of work call conn.start_transaction() explicitly
+            autocommit=True,
+            # use_pure=False would demand the C extension even where it is not installed
+            **({'use_pure': True} if app.config['MYSQL_USE_PURE'] else {})
         )
         if conn.is_connected():
-            return conn
+            return TimedConnection(conn)
         else:
             logging.error("Failed to connect to MySQL")
             return None
@@ -69,80 +399,1227 @@ def get_conn():
         logging.error(f"MySQL connection error: {e}")
         return None
 
-def daily_maintenance():
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to MySQL")
+class ConnectionPool:
+    def __init__(self, factory, size=10, max_overflow=10, recycle=3600, pre_ping=True, timeout=30):
+        self.factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []  # (conn, created_at), most recently returned last
+        self._created_at = {}
+        self._in_use = 0
+        self.counters = {
+            'checkouts': 0,
+            'connects': 0,
+            'connect_failures': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'overflow_closed': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, created_at):
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            self.counters['recycled'] += 1
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self.counters['ping_failures'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        with self._cond:
+            # Connections must never be shared across a fork (gunicorn workers)
+            if self._pid != os.getpid():
+                self._reset()
+
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use + len(self._idle) < self.size + self.max_overflow:
+                    conn, created_at = None, None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    logging.error(f"MySQL pool exhausted after {self.timeout}s ({self._in_use} connections in use)")
+                    return None
+                self.counters['waits'] += 1
+                self._cond.wait(remaining)
+
+        # Health checks and connects happen outside the lock
+        if conn is not None and not self._healthy(conn, created_at):
+            self._discard(conn)
+            conn = None
+
+        if conn is None:
+            conn = self.factory()
+            with self._cond:
+                if conn is None:
+                    self.counters['connect_failures'] += 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                    return None
+                self.counters['connects'] += 1
+                self._created_at[id(conn)] = time.monotonic()
+
+        with self._cond:
+            self.counters['checkouts'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            created_at = self._created_at.get(id(conn))
+            if discard or created_at is None:
+                self._discard(conn)
+            elif len(self._idle) >= self.size:
+                self.counters['overflow_closed'] += 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at))
+            self._cond.notify()
+
+    def dispose(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'recycle': self.recycle,
+                'pre_ping': self.pre_ping,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'overflow': max(0, self._in_use + len(self._idle) - self.size),
+                **self.counters,
+            }
+
+db_pool = ConnectionPool(
+    _connect,
+    size=app.config['MYSQL_POOL_SIZE'],
+    max_overflow=app.config['MYSQL_POOL_MAX_OVERFLOW'],
+    recycle=app.config['MYSQL_POOL_RECYCLE'],
+    pre_ping=app.config['MYSQL_POOL_PRE_PING'],
+    timeout=app.config['MYSQL_POOL_TIMEOUT']
+)
+atexit.register(db_pool.dispose)
+
+@contextmanager
+def db_conn():
+    # Yields a pooled connection, or None when the database is unreachable
+    with timed_phase('db_acquire'):
+        conn = db_pool.acquire()
+    if conn is None:
+        yield None
         return
-    
-    cur = conn.cursor()
-    
-    # Automatically checks in overdue items
-    cur.execute("""
-        UPDATE checkout 
-        SET checkin_time=NOW(), 
-            status='IN',
-            session_token = NULL
-        WHERE status='OUT' 
-        AND DATE(checkout_time) < CURDATE()
-    """)
-    checkin_count = cur.rowcount
+    discard = False
+    try:
+        yield conn
+    except Error:
+        discard = True
+        raise
+    finally:
+        db_pool.release(conn, discard=discard)
+
+class EventBroker:
+    def __init__(self, history_size=1000, queue_size=1000):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self.last_id = 0
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_id, event, data):
+        with self._lock:
+            if event_id <= self.last_id:
+                return
+            self.last_id = event_id
+            item = (event_id, event, data)
+            self._history.append(item)
+            for q in list(self._subscribers):
+                try:
+                    q.put_nowait(item)
+                except queue.Full:
+                    # A stalled client is dropped; it reconnects with Last-Event-ID
+                    self._subscribers.discard(q)
+                    q.queue.clear()
+                    q.put_nowait(None)
+
+    def advance(self, event_id):
+        # Moves past an event that is not forwarded to subscribers
+        with self._lock:
+            self.last_id = max(self.last_id, event_id)
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def replay(self, last_event_id):
+        # None means the in-memory history no longer reaches back that far
+        with self._lock:
+            if last_event_id >= self.last_id:
+                return []
+            if not self._history or self._history[0][0] > last_event_id + 1:
+                return None
+            return [item for item in self._history if item[0] > last_event_id]
+
+event_broker = None  # built by create_app()
+_event_relay_lock = threading.Lock()
+_event_relay_pid = None
+
+def _event_relay():
+    # One poller per worker process fans movement_event rows out to local subscribers
+    while True:
+        time.sleep(app.config['EVENTS_POLL_INTERVAL'])
+        idle = not event_broker.subscriber_count and not session_index.size and not employee_cache.size
+        try:
+            with db_conn() as conn:
+                if not conn:
+                    continue
+                cur = conn.cursor()
+                if idle:
+                    # Nobody needs the events themselves, but the cursor must keep up
+                    # so a later subscriber does not get a backlog it already rendered
+                    cur.execute("SELECT COALESCE(MAX(id), 0) FROM movement_event")
+                    event_broker.advance(cur.fetchone()[0])
+                    cur.close()
+                    continue
+                cur.execute(
+                    "SELECT id, event, data FROM movement_event WHERE id > %s ORDER BY id LIMIT 500",
+                    (event_broker.last_id,)
+                )
+                rows = cur.fetchall()
+                cur.close()
+            for event_id, event, data in rows:
+                data = json.loads(data)
+                if event == 'employee-invalidated':
+                    # Cache coherence between workers; browsers never see it
+                    employee_cache.invalidate(data['Employee_no'])
+                    event_broker.advance(event_id)
+                    continue
+                session_index.apply_event(event, data)
+                event_broker.publish(event_id, event, data)
+        except Exception as e:
+            logging.error(f"Event relay error: {e}")
+
+def event_relay_running():
+    return app.config['EVENTS_BACKEND'] == 'local' or _event_relay_pid == os.getpid()
+
+def start_event_relay():
+    global _event_relay_pid
+    if _event_relay_pid == os.getpid():
+        return
+    with _event_relay_lock:
+        if _event_relay_pid == os.getpid():
+            return
+        _event_relay_pid = os.getpid()
+
+        # Entries cached before the relay ran may have missed other workers' events
+        session_index.clear()
+        employee_cache.invalidate()
+
+        # Start from the newest event so a fresh worker does not replay old ones
+        with db_conn() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute("SELECT COALESCE(MAX(id), 0) FROM movement_event")
+                event_broker.last_id = max(event_broker.last_id, cur.fetchone()[0])
+                cur.close()
+
+        threading.Thread(target=_event_relay, daemon=True).start()
+
+@timed_phase('events')
+def publish_event(event, data):
+    try:
+        if app.config['EVENTS_BACKEND'] == 'local':
+            with _event_relay_lock:
+                event_broker.publish(event_broker.last_id + 1, event, data)
+            return
+
+        with db_conn() as conn:
+            if not conn:
+                logging.error(f"Failed to publish {event} event: DB connection failed")
+                return
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO movement_event (event, data) VALUES (%s, %s)",
+                (event, json.dumps(data))
+            )
+            cur.close()
+    except Exception as e:
+        logging.error(f"Failed to publish {event} event: {e}")
 
-    conn.commit()
-    cur.close()
-    conn.close()
+@timed_phase('events')
+def publish_events(event, items):
+    # Same as publish_event for a batch, in one round trip
+    if not items:
+        return
+    try:
+        if app.config['EVENTS_BACKEND'] == 'local':
+            with _event_relay_lock:
+                for data in items:
+                    event_broker.publish(event_broker.last_id + 1, event, data)
+            return
+
+        with db_conn() as conn:
+            if not conn:
+                logging.error(f"Failed to publish {len(items)} {event} events: DB connection failed")
+                return
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT INTO movement_event (event, data) VALUES (%s, %s)",
+                [(event, json.dumps(data)) for data in items]
+            )
+            cur.close()
+    except Exception as e:
+        logging.error(f"Failed to publish {len(items)} {event} events: {e}")
+
+def load_events_since(last_event_id):
+    # Replays a reconnecting client from the movement_event table
+    with db_conn() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(id) FROM movement_event")
+        oldest = cur.fetchone()[0]
+        if oldest is not None and oldest > last_event_id + 1:
+            cur.close()
+            return None
+        cur.execute(
+            "SELECT id, event, data FROM movement_event WHERE id > %s AND event <> 'employee-invalidated' ORDER BY id LIMIT %s",
+            (last_event_id, app.config['EVENTS_HISTORY_SIZE'])
+        )
+        rows = [(event_id, event, json.loads(data)) for event_id, event, data in cur.fetchall()]
+        cur.close()
+    return rows
+
+@lru_cache(maxsize=None)
+def resolve_zone(name):
+    # None means the host's zone; if that cannot be loaded db_time() falls back
+    # to astimezone(), which is correct but much slower per value
+    if name:
+        return ZoneInfo(name)
+    try:
+        if os.environ.get('TZ'):
+            return ZoneInfo(os.environ['TZ'].lstrip(':'))
+        with open('/etc/localtime', 'rb') as f:
+            return ZoneInfo.from_file(f)
+    except (OSError, ValueError, KeyError):
+        return None
+
+def db_time(value):
+    # Attaches the database's zone to a naive DATETIME
+    tz = resolve_zone(app.config['DB_TIMEZONE'])
+    return value.replace(tzinfo=tz) if tz else value.astimezone()
+
+def format_timestamp(value):
+    return db_time(value).isoformat() if value else None
+
+def parse_timestamp(value):
+    # Inverse of format_timestamp; naive input (older events) is taken as-is
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed
+    return parsed.astimezone(resolve_zone(app.config['DB_TIMEZONE'])).replace(tzinfo=None)
+
+def format_movement_row(row):
+    return {
+        'ID': row['ID'],
+        'Employee_no': row['Employee_no'],
+        'Employee_name': row['Employee_name'],
+        'Department': row['Department'],
+        'Location': row['Location'],
+        'Purpose': row['Purpose'],
+        'checkout_time': format_timestamp(row.get('checkout_time')),
+        'checkin_time': format_timestamp(row.get('checkin_time')),
+        'status': row['status']
+    }
+
+class TTLCache:
+    def __init__(self, maxsize=5000, ttl=300, negative_ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def size(self):
+        return len(self._entries)
+
+    def get(self, key):
+        # Returns (found, value); a cached None is a negative entry
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.counters['negative_hits' if entry[1] is None else 'hits'] += 1
+            return True, entry[1]
+
+    def set(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['negative_hits'] + self.counters['misses']
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'negative_ttl': self.negative_ttl,
+                'hit_ratio': round((lookups - self.counters['misses']) / lookups, 4) if lookups else None,
+                **self.counters,
+            }
+
+employee_cache = None  # built by create_app()
+
+class SingleFlight:
+    # Callers asking for the same key while a lookup is running wait for it and
+    # share its result (or exception) instead of issuing their own query
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [done event, result, exception]
+        self.counters = {}  # kind -> {'executed': n, 'coalesced': n}
+
+    def do(self, kind, key, fn):
+        if not app.config['SINGLE_FLIGHT_ENABLED']:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get((kind, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(kind, key)] = [threading.Event(), None, None]
+            counters = self.counters.setdefault(kind, {'executed': 0, 'coalesced': 0})
+            counters['executed' if leader else 'coalesced'] += 1
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = fn()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(kind, key)]
+            call[0].set()
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for kind, counters in self.counters.items():
+                total = counters['executed'] + counters['coalesced']
+                kinds[kind] = {**counters, 'coalesce_ratio': round(counters['coalesced'] / total, 4) if total else None}
+            return {'enabled': app.config['SINGLE_FLIGHT_ENABLED'], 'in_flight': len(self._calls), 'kinds': kinds}
+
+single_flight = SingleFlight()
+
+class DatabaseUnavailable(Exception):
+    pass
+
+def lookup_employee(employee_no):
+    # The relay carries other workers' invalidate_employee() calls
+    if app.config['EVENTS_BACKEND'] != 'local':
+        start_event_relay()
+
+    found, row = employee_cache.get(employee_no)
+    if not found:
+        row = single_flight.do('employee', employee_no, lambda: fetch_employee(employee_no))
+    # Cached and coalesced rows are shared; callers get their own copy
+    return dict(row) if row else None
+
+def fetch_employee(employee_no):
+    with db_conn() as conn:
+        if not conn:
+            raise DatabaseUnavailable()
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT Employee_no, Employee_name, Department FROM employee WHERE Employee_no=%s LIMIT 1", (employee_no,))
+        row = cur.fetchone()
+        cur.close()
+
+    employee_cache.set(employee_no, row)
+    return row
+
+def invalidate_employee(employee_no=None):
+    # Call after changing the employee table; None clears the whole cache. Other
+    # workers drop it when their event relay picks up the published event, so
+    # they may serve the old row for up to EVENTS_POLL_INTERVAL
+    employee_cache.invalidate(employee_no)
+    if app.config['EVENTS_BACKEND'] != 'local':
+        publish_event('employee-invalidated', {'Employee_no': employee_no})
+
+def pending_expiry_cutoff():
+    # In-process mirror of the 20 minute PENDING expiry that cleanup_pending_checkouts()
+    # applies in MySQL; only used against timestamps held in the session index
+    return datetime.now() - timedelta(minutes=20)
+
+def auto_checkin_cutoff():
+    # OUT movements from before today are checked in by daily_maintenance()
+    return datetime.combine(datetime.now().date(), datetime.min.time())
+
+def archive_cutoff():
+    # IN movements checked out before this are moved to checkout_archive, so
+    # anything newer is always in the live checkout table
+    return auto_checkin_cutoff() - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])
+
+class SessionIndex:
+    def __init__(self, ttl=300, stale_ttl=None):
+        self.ttl = ttl
+        # Entries past ttl are kept until stale_ttl for guardhouse mode's offline use
+        self.stale_ttl = max(ttl, stale_ttl or 0)
+        self._lock = threading.Lock()
+        self._by_token = {}  # token -> (Employee_no, status, ID, since, cached_at, details)
+        self._token_by_id = {}
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0}
+
+    @property
+    def size(self):
+        return len(self._by_token)
+
+    def _drop(self, token):
+        entry = self._by_token.pop(token, None)
+        if entry is not None:
+            self._token_by_id.pop(entry[2], None)
+
+    def get(self, token, allow_stale=False):
+        with self._lock:
+            entry = self._by_token.get(token)
+            if entry is not None:
+                age = time.monotonic() - entry[4]
+                if age > self.stale_ttl:
+                    self._drop(token)
+                    entry = None
+                elif age > self.ttl and not allow_stale:
+                    entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['hits'] += 1
+            return {'Employee_no': entry[0], 'status': entry[1], 'ID': entry[2], 'since': entry[3], 'details': entry[5]}
+
+    def put(self, token, employee_no, status, row_id, since, details=None):
+        # details: Employee_name, Department, Location and Purpose of the movement
+        with self._lock:
+            self._drop(token)
+            self._by_token[token] = (employee_no, status, row_id, since, time.monotonic(), details)
+            self._token_by_id[row_id] = token
+
+    def set_status_by_id(self, row_id, status, since):
+        with self._lock:
+            token = self._token_by_id.get(row_id)
+            if token is not None:
+                employee_no, _, _, _, cached_at, details = self._by_token[token]
+                self._by_token[token] = (employee_no, status, row_id, since, cached_at, details)
+
+    def clear(self):
+        with self._lock:
+            self._by_token.clear()
+            self._token_by_id.clear()
+
+    def remove_token(self, token):
+        with self._lock:
+            self._drop(token)
+
+    def remove_by_id(self, row_id):
+        with self._lock:
+            token = self._token_by_id.get(row_id)
+            if token is not None:
+                self._drop(token)
+
+    def expire(self, status, before):
+        with self._lock:
+            stale = [
+                token for token, entry in self._by_token.items()
+                if entry[1] == status and (entry[3] is None or entry[3] < before)
+            ]
+            for token in stale:
+                self._drop(token)
+            self.counters['expired'] += len(stale)
+        return len(stale)
+
+    def apply_event(self, event, data):
+        # Keeps other workers' indexes in step with changes relayed through movement_event
+        if event == 'checkout-confirmed':
+            since = parse_timestamp(data['checkout_time']) if data.get('checkout_time') else None
+            self.set_status_by_id(data['ID'], 'OUT', since)
+        elif event == 'check-in':
+            self.remove_by_id(data['ID'])
+        elif event == 'pending-expired':
+            self.expire('PENDING', pending_expiry_cutoff())
+        elif event == 'auto-check-in':
+            self.expire('OUT', auto_checkin_cutoff())
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._by_token), 'ttl': self.ttl, **self.counters}
+
+session_index = None  # built by create_app()
+
+def movement_details(row):
+    return {
+        'Employee_name': row['Employee_name'],
+        'Department': row['Department'],
+        'Location': row['Location'],
+        'Purpose': row['Purpose']
+    }
+
+def lookup_session(token):
+    # Active (PENDING/OUT) session for a checkout_session cookie, or None
+    if app.config['EVENTS_BACKEND'] != 'local':
+        start_event_relay()
+
+    # Without the relay this process would miss other workers' confirms and expiries
+    entry = session_index.get(token) if event_relay_running() else None
+    if entry:
+        return entry
+
+    return single_flight.do('session', token, lambda: fetch_session(token))
+
+def fetch_session(token):
+    with db_conn() as conn:
+        if not conn:
+            # The gate can keep working from what this process already knows
+            entry = session_index.get(token, allow_stale=True) if app.config['GUARDHOUSE_MODE'] != 'off' else None
+            if entry:
+                return entry
+            raise DatabaseUnavailable()
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, status, created_at, checkout_time 
+            FROM checkout 
+            WHERE session_token=%s 
+            AND status IN ('PENDING', 'OUT') 
+            LIMIT 1
+        """, (token,))
+        row = cur.fetchone()
+        cur.close()
+
+    if not row:
+        return None
+
+    since = row['checkout_time'] if row['status'] == 'OUT' else row['created_at']
+    details = movement_details(row)
+    session_index.put(token, row['Employee_no'], row['status'], row['ID'], since, details)
+    return {'Employee_no': row['Employee_no'], 'status': row['status'], 'ID': row['ID'], 'since': since, 'details': details}
+
+class GuardhouseJournal:
+    # Durable local log of gate actions. Entries move from 'pending' to 'synced'
+    # (or 'conflict' when MySQL no longer agrees) in the order they were recorded.
+    def __init__(self, path, sync_interval=2, keep_synced_hours=24):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.keep_synced_hours = keep_synced_hours
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._sync_pid = None
+        self.last_sync = None
+        self.counters = {'recorded': 0, 'synced': 0, 'duplicates': 0, 'conflicts': 0, 'sync_errors': 0}
+
+    def _db(self):
+        # One SQLite connection per process; WAL lets the syncer read while the gate writes
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    row_id INTEGER NOT NULL,
+                    employee_no TEXT NOT NULL,
+                    at TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    recorded_at TEXT NOT NULL,
+                    synced_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_state ON journal (state, id)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def record(self, op, token, row_id, employee_no, at, payload):
+        # Returns once the entry is on disk
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO journal (op, token, row_id, employee_no, at, payload, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (op, token, row_id, employee_no, at.strftime('%Y-%m-%d %H:%M:%S'), json.dumps(payload),
+                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            self.counters['recorded'] += 1
+        self.start()
+
+    def pending(self, limit=100):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, op, token, row_id, employee_no, at, payload FROM journal WHERE state='pending' ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{
+            'id': row[0],
+            'op': row[1],
+            'token': row[2],
+            'row_id': row[3],
+            'employee_no': row[4],
+            'at': datetime.strptime(row[5], '%Y-%m-%d %H:%M:%S'),
+            'payload': json.loads(row[6])
+        } for row in rows]
+
+    def finish(self, entry_id, state, error=None):
+        with self._lock:
+            self._db().execute(
+                "UPDATE journal SET state=?, error=?, attempts=attempts + 1, synced_at=? WHERE id=?",
+                (state, error, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), entry_id)
+            )
+
+    def prune(self):
+        cutoff = datetime.now() - timedelta(hours=self.keep_synced_hours)
+        with self._lock:
+            self._db().execute(
+                "DELETE FROM journal WHERE state='synced' AND synced_at < ?",
+                (cutoff.strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+
+    def start(self):
+        if self._sync_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sync_pid == os.getpid():
+                return
+            self._sync_pid = os.getpid()
+        threading.Thread(target=self._syncer, name='guardhouse-syncer', daemon=True).start()
+
+    def _syncer(self):
+        # Workers sharing the journal take turns through a file lock so entries
+        # are replayed by one process at a time, in order
+        lock_file = open(f"{self.path}.lock", 'a')
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue
+            try:
+                replay_journal(self)
+            except Exception as e:
+                with self._lock:
+                    self.counters['sync_errors'] += 1
+                logging.error(f"Guardhouse journal sync error: {e}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            states = dict(self._db().execute("SELECT state, COUNT(*) FROM journal GROUP BY state").fetchall())
+            oldest = self._db().execute("SELECT MIN(recorded_at) FROM journal WHERE state='pending'").fetchone()[0]
+            return {
+                'mode': app.config['GUARDHOUSE_MODE'],
+                'path': self.path,
+                'pending': states.get('pending', 0),
+                'synced': states.get('synced', 0),
+                'conflict': states.get('conflict', 0),
+                'oldest_pending': oldest,
+                'last_sync': self.last_sync.strftime('%Y-%m-%d %H:%M:%S') if self.last_sync else None,
+                **self.counters,
+            }
+
+guardhouse_journal = None  # built by create_app()
+
+def apply_journal_entry(conn, cur, entry):
+    # Idempotent: an entry that already reached MySQL (e.g. replayed again after
+    # a crash between the UPDATE and finish()) is recognised by its timestamp
+    if entry['op'] == 'confirm':
+        cur.execute("""
+            UPDATE checkout 
+            SET checkout_time=%s, status='OUT', updated_at=NOW(6) 
+            WHERE ID=%s AND session_token=%s AND status='PENDING'
+        """, (entry['at'], entry['row_id'], entry['token']))
+        if cur.rowcount:
+            return 'synced'
+        cur.execute("SELECT status, checkout_time FROM checkout WHERE ID=%s", (entry['row_id'],))
+        row = cur.fetchone()
+        if row and row['status'] in ('OUT', 'IN') and row['checkout_time'] == entry['at']:
+            return 'duplicate'
+        if row:
+            return 'conflict'
+
+        # cleanup_pending_checkouts() deleted the PENDING row while this gate was
+        # offline; the journal holds everything needed to put it back, under the
+        # same ID so a later journaled check-in still finds it
+        details = entry['payload']
+        try:
+            cur.execute("""
+                INSERT INTO checkout (ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, status, session_token, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'OUT', %s, NOW(6))
+            """, (entry['row_id'], entry['employee_no'], details['Employee_name'], details['Department'],
+                  details['Location'], details['Purpose'], entry['at'], entry['token']))
+        except mysql.connector.IntegrityError as e:
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            # The employee has started another movement since
+            return 'conflict'
+        logging.warning(f"Guardhouse confirm for movement {entry['row_id']} ({entry['employee_no']}) restored a row removed by pending cleanup")
+        return 'synced'
+
+    # The rollup shares the check-in's transaction: if it fails, the entry stays
+    # pending and is retried whole rather than later mistaken for a duplicate
+    with rollup_lock(conn) as locked:
+        if not locked:
+            raise RollupBusy("Timed out waiting for the movement rollup lock")
+        conn.start_transaction()
+        try:
+            cur.execute("""
+                UPDATE checkout 
+                SET checkin_time=%s, status='IN', updated_at=NOW(6) 
+                WHERE ID=%s AND status='OUT'
+            """, (entry['at'], entry['row_id']))
+            if cur.rowcount:
+                details = entry['payload']
+                checkout_time = datetime.strptime(details['checkout_time'], '%Y-%m-%d %H:%M:%S') if details.get('checkout_time') else None
+                add_to_rollup(cur, [(entry['employee_no'], details['Department'], checkout_time, entry['at'])])
+                conn.commit()
+                return 'synced'
+            conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+    cur.execute("SELECT status, checkin_time FROM checkout WHERE ID=%s", (entry['row_id'],))
+    row = cur.fetchone()
+    if row and row['status'] == 'IN' and row['checkin_time'] == entry['at']:
+        return 'duplicate'
+    return 'conflict'
+
+def replay_journal(journal):
+    while True:
+        entries = journal.pending()
+        if not entries:
+            break
+
+        for entry in entries:
+            with db_conn() as conn:
+                if not conn:
+                    # Still offline; later entries wait so the order is preserved
+                    return
+                cur = conn.cursor(dictionary=True)
+                outcome = apply_journal_entry(conn, cur, entry)
+                cur.close()
+
+            if outcome == 'conflict':
+                logging.error(f"Guardhouse {entry['op']} for movement {entry['row_id']} ({entry['employee_no']}) no longer applies; kept in the journal as a conflict")
+                journal.finish(entry['id'], 'conflict', 'row changed before the journal was replayed')
+            else:
+                journal.finish(entry['id'], 'synced')
+            with journal._lock:
+                journal.counters[{'synced': 'synced', 'duplicate': 'duplicates', 'conflict': 'conflicts'}[outcome]] += 1
+
+            # Events and emails go out once the change is in MySQL
+            if outcome == 'synced':
+                announce_journal_entry(entry)
+
+    journal.last_sync = datetime.now()
+    journal.prune()
+
+def announce_journal_entry(entry):
+    details = entry['payload']
+    row = {'ID': entry['row_id'], 'Employee_no': entry['employee_no'], **movement_details(details)}
+    if entry['op'] == 'confirm':
+        publish_event('checkout-confirmed', format_movement_row({
+            **row, 'checkout_time': entry['at'], 'checkin_time': None, 'status': 'OUT'
+        }))
+        send_checkout_notification(
+            row['Employee_no'], row['Employee_name'], row['Department'], row['Location'], row['Purpose'], entry['at']
+        )
+        return
+
+    checkout_time = datetime.strptime(details['checkout_time'], '%Y-%m-%d %H:%M:%S') if details.get('checkout_time') else None
+    publish_event('check-in', format_movement_row({
+        **row, 'checkout_time': checkout_time, 'checkin_time': entry['at'], 'status': 'IN'
+    }))
+    send_checkin_notification(
+        row['Employee_no'], row['Employee_name'], row['Department'], row['Location'], row['Purpose'],
+        checkout_time, entry['at'], format_duration(checkout_time, entry['at'])
+    )
+
+def format_duration(checkout_time, checkin_time):
+    if not checkout_time:
+        return None
+    seconds = int((checkin_time - checkout_time).total_seconds())
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    return f"{hours}h {minutes}m"
+
+maintenance_runs = {}
+
+def run_in_batches(name, select_sql, params, apply_sql, apply_params=()):
+    # Walks the rows matched by select_sql (which must select the primary key) in
+    # ascending key order and applies apply_sql to each batch; apply_sql receives
+    # the batch through its {ids} placeholder and should re-check its predicate.
+    # A list of statements runs in one transaction and reports the last rowcount.
+    statements = apply_sql if isinstance(apply_sql, (list, tuple)) else [apply_sql]
+    batch_size = app.config['MAINTENANCE_BATCH_SIZE']
+    pause = app.config['MAINTENANCE_BATCH_PAUSE']
+    started = time.monotonic()
+    affected = 0
+    batches = 0
+    last_id = 0
+    completed = True
+
+    while True:
+        with db_conn() as conn:
+            if not conn:
+                logging.error(f"{name}: failed to connect to MySQL after {batches} batches")
+                completed = False
+                break
+
+            cur = conn.cursor()
+            cur.execute(f"{select_sql} AND id > %s ORDER BY id LIMIT %s", (*params, last_id, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                cur.close()
+                break
+
+            placeholders = ', '.join(['%s'] * len(ids))
+            if len(statements) > 1:
+                conn.start_transaction()
+            for stmt in statements:
+                cur.execute(stmt.replace('{ids}', placeholders), (*apply_params, *ids))
+            if len(statements) > 1:
+                conn.commit()
+            affected += cur.rowcount
+            cur.close()
+
+        batches += 1
+        last_id = ids[-1]
+        if batches % 10 == 0:
+            logging.info(f"{name}: {affected} rows in {batches} batches so far")
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    record_job_run(name, affected, batches, time.monotonic() - started, completed)
+    return affected
+
+def record_job_run(name, rows, batches, elapsed, completed=True):
+    metrics.observe('scheduler_job_duration_seconds', (('job', name),), elapsed)
+    metrics.inc('scheduler_job_rows_total', (('job', name),), rows)
+    maintenance_runs[name] = {
+        'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': rows,
+        'batches': batches,
+        'seconds': round(elapsed, 3),
+        'completed': completed,
+    }
+    logging.info(f"{name}: {rows} rows in {batches} batches ({elapsed:.2f}s)")
+
+def daily_maintenance():
+    # Automatically checks in overdue items (checked out before today). The
+    # check-in time comes from this host, like the checkout_time it is paired
+    # with, so durations never mix the app and MySQL clocks
+    checkin_time = datetime.now()
+    checkin_count = run_in_batches(
+        'daily_maintenance',
+        "SELECT ID FROM checkout WHERE status='OUT' AND checkout_time < CURDATE()",
+        (),
+        """
+            UPDATE checkout 
+            SET checkin_time=%s, 
+                status='IN',
+                session_token = NULL,
+                updated_at = NOW(6)
+            WHERE ID IN ({ids}) 
+            AND status='OUT'
+        """,
+        (checkin_time,)
+    )
+
+    session_index.expire('OUT', auto_checkin_cutoff())
+    if checkin_count:
+        publish_event('auto-check-in', {'count': checkin_count})
 
     logging.info(
         f"Daily maintenance completed: {checkin_count} auto check-ins"
     )
 
 def cleanup_session_tokens():
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to MySQL")
-        return
+    # Clean up session tokens 15 minutes after check-in
+    cleanup_count = run_in_batches(
+        'cleanup_session_tokens',
+        "SELECT ID FROM checkout WHERE session_token IS NOT NULL AND status = 'IN' AND checkin_time < NOW() - INTERVAL 15 MINUTE",
+        (),
+        """
+            UPDATE checkout 
+            SET session_token = NULL,
+                updated_at = NOW(6)
+            WHERE ID IN ({ids}) 
+            AND status = 'IN'
+        """
+    )
 
-    cur = conn.cursor()
+    logging.info(f"Session cleanup: {cleanup_count} tokens cleared")
 
-    # Clean up session tokens older than 12 hours
-    cur.execute("""
-        UPDATE checkout 
-        SET session_token = NULL 
-        WHERE session_token IS NOT NULL 
-        AND status = 'IN'
-        AND checkin_time IS NOT NULL
-        AND checkin_time < NOW() - INTERVAL 15 MINUTE
-    """)
-    cleanup_count = cur.rowcount
+def cleanup_pending_checkouts():
+    # Delete old pending checkout requests (> 20 minutes)
+    # created_at is written by MySQL, so the cutoff is computed there too
+    pending_cleanup = run_in_batches(
+        'cleanup_pending_checkouts',
+        "SELECT ID FROM checkout WHERE status = 'PENDING' AND created_at < NOW() - INTERVAL 20 MINUTE",
+        (),
+        """
+            DELETE FROM checkout
+            WHERE ID IN ({ids})
+            AND status = 'PENDING'
+        """
+    )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    session_index.expire('PENDING', pending_expiry_cutoff())
+    if pending_cleanup:
+        publish_event('pending-expired', {'count': pending_cleanup})
 
-    logging.info(f"Session cleanup: {cleanup_count} tokens cleared")
+    logging.info(f"Pending checkout cleanup: {pending_cleanup} records removed")
 
-def cleanup_pending_checkouts():
-    conn = get_conn()
-    if not conn:
-        logging.error("Failed to connect to MySQL")
-        return
+def archive_completed_movements():
+    # Copy and delete happen in the same transaction, so a row is never in both tables
+    archived = run_in_batches(
+        'archive_completed_movements',
+        "SELECT ID FROM checkout WHERE status = 'IN' AND checkout_time < %s",
+        (archive_cutoff(),),
+        [
+            """
+                INSERT INTO checkout_archive 
+                    (ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status, created_at)
+                SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status, created_at
+                FROM checkout
+                WHERE ID IN ({ids})
+                AND status = 'IN'
+            """,
+            """
+                DELETE FROM checkout
+                WHERE ID IN ({ids})
+                AND status = 'IN'
+            """
+        ]
+    )
 
+    logging.info(f"Archival: {archived} completed movements moved to checkout_archive")
+
+def rollup_rows(movements):
+    # movements: (Employee_no, Department, checkout_time, checkin_time) of
+    # completed movements; returns movement_rollup increments merged per key
+    totals = {}
+    for employee_no, department, checkout_time, checkin_time in movements:
+        if not checkout_time or not checkin_time:
+            continue
+        seconds = max(0, int((checkin_time - checkout_time).total_seconds()))
+        day = checkout_time.date()
+        for key in ((day, department, employee_no), (day, department, '*'), (day, '*', '*')):
+            count, total, longest = totals.get(key, (0, 0, 0))
+            totals[key] = (count + 1, total + seconds, max(longest, seconds))
+    return [(*key, *values) for key, values in totals.items()]
+
+def add_to_rollup(cur, movements):
+    # Runs on the caller's connection so it can share the check-in transaction
+    rows = rollup_rows(movements)
+    if not rows:
+        return
+    cur.executemany("""
+        INSERT INTO movement_rollup (day, Department, Employee_no, movements, total_seconds, max_seconds) 
+        VALUES (%s, %s, %s, %s, %s, %s) 
+        ON DUPLICATE KEY UPDATE 
+            movements = movements + VALUES(movements), 
+            total_seconds = total_seconds + VALUES(total_seconds), 
+            max_seconds = GREATEST(max_seconds, VALUES(max_seconds))
+    """, rows)
+
+class RollupBusy(Exception):
+    pass
+
+@contextmanager
+def rollup_lock(conn):
+    # Held around a check-in's UPDATE and its rollup increment, and around
+    # rebuild_rollup(), so a rebuild can never count a movement whose increment
+    # is still to come. Yields whether the lock was obtained.
     cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (app.config['ANALYTICS_ROLLUP_LOCK'], app.config['ANALYTICS_ROLLUP_LOCK_TIMEOUT']))
+    row = cur.fetchone()
+    locked = bool(row and row[0] == 1)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (app.config['ANALYTICS_ROLLUP_LOCK'],))
+            cur.fetchone()
+        cur.close()
 
-    # Delete old pending checkout requests (> 20 minutes)
+def record_rollup(cur, movements, locked=True):
+    # For check-ins that have already committed: a failed rollup write is left
+    # to refresh_movement_rollup() instead of failing the check-in
+    if not locked:
+        metrics.inc('analytics_rollup_errors_total')
+        logging.error("Movement rollup lock not obtained, increment left for the nightly refresh")
+        return
+    try:
+        add_to_rollup(cur, movements)
+    except Error as e:
+        metrics.inc('analytics_rollup_errors_total')
+        logging.error(f"Movement rollup update failed, left for the nightly refresh: {e}")
+
+def rebuild_rollup(conn, start_day, end_day):
+    # Recomputes [start_day, end_day) from the raw movements, archive included
+    with rollup_lock(conn) as locked:
+        if not locked:
+            raise RollupBusy("Timed out waiting for the movement rollup lock")
+        return _rebuild_rollup(conn, start_day, end_day)
+
+def _rebuild_rollup(conn, start_day, end_day):
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day, datetime.min.time())
+    cur = conn.cursor()
+    conn.start_transaction()
+    cur.execute("DELETE FROM movement_rollup WHERE day >= %s AND day < %s", (start_day, end_day))
     cur.execute("""
-        DELETE FROM checkout
-        WHERE status = 'PENDING'
-        AND created_at < NOW() - INTERVAL 20 MINUTE
-    """)
-    pending_cleanup = cur.rowcount
-
+        INSERT INTO movement_rollup (day, Department, Employee_no, movements, total_seconds, max_seconds) 
+        SELECT DATE(checkout_time), Department, Employee_no, COUNT(*), 
+               SUM(TIMESTAMPDIFF(SECOND, checkout_time, checkin_time)), 
+               MAX(TIMESTAMPDIFF(SECOND, checkout_time, checkin_time)) 
+        FROM (
+            SELECT Employee_no, Department, checkout_time, checkin_time FROM checkout 
+            WHERE status = 'IN' AND checkout_time >= %s AND checkout_time < %s AND checkin_time >= checkout_time 
+            UNION ALL 
+            SELECT Employee_no, Department, checkout_time, checkin_time FROM checkout_archive 
+            WHERE status = 'IN' AND checkout_time >= %s AND checkout_time < %s AND checkin_time >= checkout_time
+        ) AS completed 
+        GROUP BY DATE(checkout_time), Department, Employee_no
+    """, (start, end, start, end))
+    employees = cur.rowcount
+    # Department and company rows are summed from the employee rows just written
+    cur.execute("""
+        INSERT INTO movement_rollup (day, Department, Employee_no, movements, total_seconds, max_seconds) 
+        SELECT day, Department, '*', SUM(movements), SUM(total_seconds), MAX(max_seconds) 
+        FROM movement_rollup 
+        WHERE day >= %s AND day < %s AND Department <> '*' AND Employee_no <> '*' 
+        GROUP BY day, Department
+    """, (start_day, end_day))
+    cur.execute("""
+        INSERT INTO movement_rollup (day, Department, Employee_no, movements, total_seconds, max_seconds) 
+        SELECT day, '*', '*', SUM(movements), SUM(total_seconds), MAX(max_seconds) 
+        FROM movement_rollup 
+        WHERE day >= %s AND day < %s AND Department <> '*' AND Employee_no = '*' 
+        GROUP BY day
+    """, (start_day, end_day))
     conn.commit()
     cur.close()
-    conn.close()
+    return employees
+
+def refresh_movement_rollup():
+    # Picks up what incremental updates cannot see: auto check-ins from
+    # daily_maintenance(), and any check-in whose rollup write failed
+    started = time.monotonic()
+    end_day = datetime.now().date() + timedelta(days=1)
+    start_day = end_day - timedelta(days=app.config['ANALYTICS_REFRESH_DAYS'] + 1)
+    with db_conn() as conn:
+        if not conn:
+            logging.error("refresh_movement_rollup: failed to connect to MySQL")
+            record_job_run('refresh_movement_rollup', 0, 0, time.monotonic() - started, completed=False)
+            return
+        try:
+            rows = rebuild_rollup(conn, start_day, end_day)
+        except RollupBusy as e:
+            logging.error(f"refresh_movement_rollup: {e}")
+            record_job_run('refresh_movement_rollup', 0, 0, time.monotonic() - started, completed=False)
+            return
+    record_job_run('refresh_movement_rollup', rows, 1, time.monotonic() - started)
+
+def cleanup_movement_events():
+    if app.config['EVENTS_BACKEND'] == 'local':
+        return
+
+    event_cleanup = run_in_batches(
+        'cleanup_movement_events',
+        "SELECT id FROM movement_event WHERE created_at < NOW() - INTERVAL %s MINUTE",
+        (app.config['EVENTS_RETENTION_MINUTES'],),
+        "DELETE FROM movement_event WHERE id IN ({ids})"
+    )
+
+    logging.info(f"Event cleanup: {event_cleanup} events removed")
 
-    logging.info(f"Pending checkout cleanup: {pending_cleanup} records removed")
-  
 scheduler = BackgroundScheduler()
 
 # Every 1 minute → pending cleanup
@@ -163,6 +1640,15 @@ scheduler.add_job(
     replace_existing=True
 )
 
+# Every 10 minutes → live feed event cleanup
+scheduler.add_job(
+    cleanup_movement_events,
+    trigger="interval",
+    minutes=10,
+    id="cleanup_movement_events",
+    replace_existing=True
+)
+
 # Once per day → daily maintenance
 scheduler.add_job(
     daily_maintenance,
@@ -173,8 +1659,152 @@ scheduler.add_job(
     replace_existing=True
 )
 
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown())
+# Once per day, after the auto check-ins → analytics rollup refresh
+scheduler.add_job(
+    refresh_movement_rollup,
+    trigger="cron",
+    hour=20,
+    minute=30,
+    id="refresh_movement_rollup",
+    replace_existing=True
+)
+
+# Once per day → move old completed movements to the archive
+scheduler.add_job(
+    archive_completed_movements,
+    trigger="cron",
+    hour=2,
+    minute=30,
+    id="archive_completed_movements",
+    replace_existing=True
+)
+
+class SchedulerLeader:
+    def __init__(self, scheduler, backend='mysql', lock_name=None, lock_file=None, retry=15):
+        self.scheduler = scheduler
+        self.backend = backend
+        self.lock_name = lock_name
+        self.lock_file = lock_file
+        self.retry = retry
+        self.is_leader = False
+        self.leader_since = None
+        self.elections_won = 0
+        self._conn = None
+        self._fd = None
+        self._stop = threading.Event()
+
+    def _acquire(self):
+        if self.backend == 'file':
+            fd = open(self.lock_file, 'a')
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fd.close()
+                return False
+            self._fd = fd
+            return True
+
+        # The lock lives as long as this session; if the process dies MySQL releases it
+        conn = _connect()
+        if not conn:
+            return False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            acquired = cur.fetchone()[0] == 1
+            cur.close()
+        except Error as e:
+            logging.error(f"Scheduler leader election failed: {e}")
+            acquired = False
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return acquired
+
+    def _still_leader(self):
+        if self.backend == 'file':
+            return True
+        try:
+            self._conn.ping(reconnect=False)
+            cur = self._conn.cursor()
+            cur.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.lock_name,))
+            held = cur.fetchone()[0] == 1
+            cur.close()
+            return held
+        except Error:
+            return False
+
+    def _release(self):
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._fd.close()
+            except OSError:
+                pass
+            self._fd = None
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Error:
+                pass
+            self._conn = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.is_leader and not self._still_leader():
+                logging.warning(f"Scheduler leadership lost in pid {os.getpid()}, pausing jobs")
+                self.scheduler.pause()
+                self._release()
+                self.is_leader = False
+                self.leader_since = None
+            elif not self.is_leader and self._acquire():
+                logging.info(f"Scheduler leadership acquired by pid {os.getpid()}")
+                self.is_leader = True
+                self.leader_since = datetime.now()
+                self.elections_won += 1
+                self.scheduler.resume()
+            self._stop.wait(self.retry)
+
+    def start(self):
+        threading.Thread(target=self._run, name='scheduler-leader', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self.is_leader:
+            self._release()
+            self.is_leader = False
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'backend': self.backend,
+            'is_leader': self.is_leader,
+            'leader_since': self.leader_since.strftime('%Y-%m-%d %H:%M:%S') if self.leader_since else None,
+            'elections_won': self.elections_won,
+        }
+
+scheduler_leader = SchedulerLeader(
+    scheduler,
+    backend=app.config['SCHEDULER_LOCK_BACKEND'],
+    lock_name=app.config['SCHEDULER_LOCK_NAME'],
+    lock_file=app.config['SCHEDULER_LOCK_FILE'],
+    retry=app.config['SCHEDULER_LEADER_RETRY']
+)
+
+def start_scheduler():
+    # Threads do not survive a fork, so this runs in the worker, never at import
+    if scheduler.running:
+        return
+    if app.config['SCHEDULER_MODE'] == 'always':
+        scheduler.start()
+    elif app.config['SCHEDULER_MODE'] == 'leader':
+        # Jobs stay paused until this process wins the election
+        scheduler.start(paused=True)
+        scheduler_leader.start()
+
+atexit.register(scheduler_leader.stop)
+atexit.register(lambda: scheduler.shutdown() if scheduler.running else None)
 
 @app.route('/')
 def home():
@@ -184,6 +1814,12 @@ def home():
 def favicon():
     return '', 204
 
+@app.route('/db-pool-stats', methods=['GET'])
+def db_pool_stats():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify(db_pool.stats())
+
 @app.route('/checkout-form')
 def checkout_form():
     return render_template('checkout.html')
@@ -194,7 +1830,7 @@ def checkin_form():
 
 @app.route('/dashboard')
 def dashboard_page():
-    return render_template('dashboard.html')
+    return render_template('dashboard.html', live_events=app.config['EVENTS_STREAMING'])
 
 @app.route('/scan-preregister', methods=['GET'])
 def scan_preregister():
@@ -205,20 +1841,10 @@ def scan_confirm():
     token = request.cookies.get('checkout_session')
     
     if token:
-        conn = get_conn()
-        if not conn:
+        try:
+            row = lookup_session(token)
+        except DatabaseUnavailable:
             return jsonify({'error': 'Database connection failed'}), 500
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT Employee_no, status 
-            FROM checkout 
-            WHERE session_token=%s 
-            AND status IN ('PENDING', 'OUT') 
-            LIMIT 1
-        """, (token,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
 
         if row:
             if row['status'] == 'PENDING':
@@ -234,18 +1860,399 @@ def scan_confirm():
 
 @app.route('/employee/<employee_no>', methods=['GET'])
 def get_employee(employee_no):
-    conn = get_conn()
-    if not conn:
+    try:
+        row = lookup_employee(employee_no)
+    except DatabaseUnavailable:
         return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT Employee_no, Employee_name, Department FROM employee WHERE Employee_no=%s LIMIT 1", (employee_no,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
     if row:
         return jsonify(row)
     return jsonify({'error': 'not found'}), 404
 
+@app.route('/scheduler-status', methods=['GET'])
+def scheduler_status():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    jobs = []
+    if scheduler.running:
+        for job in scheduler.get_jobs():
+            jobs.append({
+                'id': job.id,
+                'next_run_time': job.next_run_time.strftime('%Y-%m-%d %H:%M:%S') if job.next_run_time else None
+            })
+    return jsonify({
+        'mode': app.config['SCHEDULER_MODE'],
+        'running': scheduler.running,
+        **scheduler_leader.stats(),
+        'jobs': jobs,
+        'last_runs': maintenance_runs
+    })
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if app.config['PROFILING_ENABLED']:
+        g.timings = {}
+        g.statements = []
+        g.statement_count = 0
+    if _services_pid != os.getpid():
+        start_services()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule keeps /checkin/<employee_no> as one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        metrics.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        if response.status_code >= 500:
+            metrics.inc('http_request_errors_total', labels)
+    return response
+
+slow_request_log = logging.getLogger('slow_requests')
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('timings')
+    started = g.get('request_started')
+    if timings is None or started is None:
+        return response
+
+    total = time.perf_counter() - started
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items() if name != 'db']
+    if 'db' in timings:
+        parts.append(f'db;dur={timings["db"] * 1000:.1f};desc="{g.statement_count} queries"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    response.headers['Server-Timing'] = ', '.join(parts)
+
+    if total * 1000 >= app.config['SLOW_REQUEST_MS']:
+        # EXPLAIN needs its own round trips, so it runs after the response is sent
+        report = {
+            'route': f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'phases': {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+            'statements': list(g.statements),
+        }
+        response.call_on_close(lambda: log_slow_request(report))
+    return response
+
+def log_slow_request(report):
+    lines = [f"Slow request {report['route']} -> {report['status']} in {report['total_ms']}ms, phases {report['phases']}"]
+    statements = sorted(report['statements'], key=lambda s: s[2], reverse=True)
+    for i, (sql, params, elapsed) in enumerate(statements):
+        stmt = ' '.join(sql.split())
+        # Parameters are never logged; they can hold session tokens
+        lines.append(f"  {elapsed * 1000:.1f}ms  {stmt[:2000]}")
+        if i < 3 and params is not None and app.config['SLOW_REQUEST_EXPLAIN'] and re.match(r'(SELECT|UPDATE|DELETE)\b', stmt, re.IGNORECASE):
+            try:
+                with db_conn() as conn:
+                    if not conn:
+                        continue
+                    cur = conn.cursor(dictionary=True)
+                    cur.execute(f"EXPLAIN {stmt}", params)
+                    for row in cur.fetchall():
+                        lines.append(f"      EXPLAIN table={row.get('table')} type={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra')}")
+                    cur.close()
+            except Exception as e:
+                lines.append(f"      EXPLAIN failed: {e}")
+    slow_request_log.warning("\n".join(lines))
+
+class SamplingProfiler:
+    # Samples every thread's stack at a fixed interval and aggregates them in
+    # the folded format read by flamegraph.pl and speedscope
+    def __init__(self, interval=0.005, output_dir='/tmp'):
+        self.interval = interval
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running:
+                return False
+            # Also reached from SIGUSR2 with PROFILER_INTERVAL, so clamp here too
+            self.interval = min(max(interval or self.interval, 0.001), 1.0)
+            self._stacks = {}
+            self.samples = 0
+            self.started_at = datetime.now()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logging.info(f"Sampling profiler started in pid {os.getpid()} (every {self.interval * 1000:.1f}ms)")
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ';'.join(reversed(stack))
+                with self._lock:
+                    self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        # Returns the folded stacks and writes them next to the other worker dumps
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        with self._lock:
+            folded = "\n".join(f"{stack} {count}" for stack, count in sorted(self._stacks.items())) + "\n"
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{datetime.now().strftime('%Y%m%d%H%M%S')}.folded")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(folded)
+            logging.info(f"Sampling profiler stopped: {self.samples} samples written to {path}")
+        except OSError as e:
+            logging.error(f"Could not write profile to {path}: {e}")
+        return folded
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'running': self.running,
+            'interval': self.interval,
+            'samples': self.samples,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+        }
+
+profiler = None  # built by create_app()
+
+def toggle_profiler(signum, frame):
+    # kill -USR2 <worker pid> starts profiling that worker; a second signal stops it
+    if running_on_gevent():
+        logging.warning("Sampling profiler is not available under gevent workers")
+        return
+    if profiler.running:
+        threading.Thread(target=profiler.stop, daemon=True).start()
+    else:
+        profiler.start()
+
+@app.route('/profiler', methods=['GET'])
+def profiler_status():
+    if not app.config['PROFILING_ENABLED']:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify(profiler.stats())
+
+@app.route('/profiler/start', methods=['POST'])
+def profiler_start():
+    if not app.config['PROFILING_ENABLED']:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    # sys._current_frames() only sees OS threads; under gevent every request is a
+    # greenlet on the one hub thread, so the samples would show nothing useful
+    if running_on_gevent():
+        return jsonify({'error': 'Sampling profiler is not available under gevent workers; profile a sync worker'}), 409
+    try:
+        interval = float(request.args['interval']) if request.args.get('interval') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid interval'}), 400
+    # 1ms-1s; anything shorter turns the sampler into a busy loop
+    if interval is not None and not 0.001 <= interval <= 1.0:
+        return jsonify({'error': 'Invalid interval', 'min': 0.001, 'max': 1.0}), 400
+    if not profiler.start(interval):
+        return jsonify({'error': 'Profiler already running', **profiler.stats()}), 409
+    return jsonify(profiler.stats())
+
+@app.route('/profiler/stop', methods=['POST'])
+def profiler_stop():
+    # Only profiles the worker that happens to serve the request; use SIGUSR2
+    # to pick a specific gunicorn worker
+    if not app.config['PROFILING_ENABLED']:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    if not profiler.running:
+        return jsonify({'error': 'Profiler is not running'}), 409
+    return Response(profiler.stop(), mimetype='text/plain')
+
+def collect_gauges():
+    pool = db_pool.stats()
+    mail = notifier.stats()
+    gauges = [
+        ('db_pool_connections', 'gauge', 'Pooled MySQL connections by state', (('state', 'idle'),), pool['idle']),
+        ('db_pool_connections', 'gauge', 'Pooled MySQL connections by state', (('state', 'in_use'),), pool['in_use']),
+        ('db_pool_size', 'gauge', 'Configured pool size', (), pool['size']),
+        ('db_pool_max_overflow', 'gauge', 'Configured pool overflow', (), pool['max_overflow']),
+        ('notification_queue_depth', 'gauge', 'Notifications waiting for an SMTP worker', (), mail['queue_depth']),
+        ('notification_queue_size', 'gauge', 'Notification queue capacity', (), mail['queue_size']),
+        ('notification_workers', 'gauge', 'Live SMTP worker threads', (), mail['workers']),
+        ('notification_digest_pending_events', 'gauge', 'Events waiting for the next digest', (), digest.stats()['pending_events']),
+        ('session_index_entries', 'gauge', 'Cached session tokens', (), session_index.stats()['size']),
+        ('employee_cache_entries', 'gauge', 'Cached employee records', (), employee_cache.stats()['size']),
+        ('scheduler_is_leader', 'gauge', 'Whether this process runs the scheduler jobs', (), int(scheduler_leader.is_leader if app.config['SCHEDULER_MODE'] == 'leader' else scheduler.running)),
+    ]
+    for key in ('checkouts', 'connects', 'connect_failures', 'recycled', 'ping_failures', 'overflow_closed', 'waits', 'timeouts'):
+        gauges.append((f"db_pool_{key}_total", 'counter', f"Connection pool {key.replace('_', ' ')}", (), pool[key]))
+    for key in ('queued', 'sent', 'failed', 'retries', 'dropped', 'connects'):
+        gauges.append((f"notification_{key}_total", 'counter', f"Notifications {key}", (), mail[key]))
+    if app.config['GUARDHOUSE_MODE'] != 'off':
+        journal = guardhouse_journal.stats()
+        gauges.append(('guardhouse_journal_pending', 'gauge', 'Gate actions not yet replayed to MySQL', (), journal['pending']))
+        gauges.append(('guardhouse_journal_conflicts', 'gauge', 'Gate actions MySQL rejected on replay', (), journal['conflict']))
+    for kind, counters in sorted(single_flight.stats()['kinds'].items()):
+        gauges.append(('single_flight_executed_total', 'counter', 'Lookups that ran their own query', (('kind', kind),), counters['executed']))
+        gauges.append(('single_flight_coalesced_total', 'counter', 'Lookups that shared a concurrent query', (('kind', kind),), counters['coalesced']))
+    for job, run in sorted(maintenance_runs.items()):
+        labels = (('job', job),)
+        gauges.append(('scheduler_job_last_rows', 'gauge', 'Rows affected by the last run of each job', labels, run['rows']))
+        gauges.append(('scheduler_job_last_seconds', 'gauge', 'Duration of the last run of each job', labels, run['seconds']))
+        gauges.append(('scheduler_job_last_batches', 'gauge', 'Batches in the last run of each job', labels, run['batches']))
+    return gauges
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Counters are per process; scrape each gunicorn worker or sum across them
+    # Left open for the scraper, which has no HR session; it exposes only
+    # aggregate counts, never employee data
+    return Response(metrics.render(collect_gauges()), mimetype='text/plain; version=0.0.4')
+
+_static_fingerprints = {}  # filename -> (mtime, size, digest)
+_static_compressed = {}  # (filename, digest, encoding) -> bytes
+
+def static_fingerprint(filename):
+    # Content hash of a static file, recomputed only when the file changes
+    path = safe_join(app.static_folder, filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(filename)
+    if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    _static_fingerprints[filename] = (stat.st_mtime, stat.st_size, digest)
+    return digest
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) emits /static/<file>?v=<content hash>
+    if endpoint == 'static' and 'v' not in values:
+        digest = static_fingerprint(values.get('filename', ''))
+        if digest:
+            values['v'] = digest
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=4)
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'])
+
+@app.after_request
+def cache_and_compress(response):
+    if request.endpoint == 'static' and response.status_code == 200:
+        # A URL carrying the current hash never changes content; anything else revalidates
+        digest = static_fingerprint(request.view_args.get('filename', ''))
+        if digest and request.args.get('v') == digest:
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+    else:
+        digest = None
+
+    if (
+        response.status_code != 200
+        or request.method == 'HEAD'
+        or (response.is_streamed and not digest)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in app.config['COMPRESS_MIMETYPES']
+        or (response.content_length or 0) < app.config['COMPRESS_MIN_SIZE']
+    ):
+        return response
+
+    encoding = choose_encoding()
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    if digest:
+        # Static files are compressed once per version
+        key = (request.view_args['filename'], digest, encoding)
+        body = _static_compressed.get(key)
+        if body is None:
+            response.direct_passthrough = False
+            body = _static_compressed[key] = compress_body(response.get_data(), encoding)
+    else:
+        body = compress_body(response.get_data(), encoding)
+
+    response.direct_passthrough = False
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/guardhouse-status', methods=['GET'])
+def guardhouse_status():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    if app.config['GUARDHOUSE_MODE'] == 'off':
+        return jsonify({'mode': 'off'})
+    return jsonify(guardhouse_journal.stats())
+
+@app.route('/notification-stats', methods=['GET'])
+def notification_stats():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify({**notifier.stats(), 'digest': digest.stats()})
+
+@app.route('/session-index', methods=['GET'])
+def session_index_stats():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify(session_index.stats())
+
+@app.route('/employee-cache', methods=['GET'])
+def employee_cache_stats():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify(employee_cache.stats())
+
+@app.route('/single-flight', methods=['GET'])
+def single_flight_stats():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    return jsonify(single_flight.stats())
+
+@app.route('/employee-cache/invalidate', methods=['POST'])
+def employee_cache_invalidate():
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+    data = request.get_json(silent=True) or {}
+    invalidate_employee(data.get('Employee_no'))
+    return jsonify({'success': True})
+
 @app.route('/checkout', methods=['POST'])
 def checkout():
     data = request.json
@@ -253,44 +2260,50 @@ def checkout():
     if not data or not all(k in data for k in required):
         return jsonify({'error': 'Missing fields'}), 400
 
-    conn = get_conn()
-    if not conn:
+    try:
+        emp_row = lookup_employee(data['Employee_no'])
+    except DatabaseUnavailable:
         return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
 
-    cur.execute("SELECT Employee_name FROM employee WHERE Employee_no=%s LIMIT 1", (data['Employee_no'],))
-    emp_row = cur.fetchone()
-    
     if not emp_row:
-        cur.close()
-        conn.close()
         return jsonify({'error': 'Employee not found'}), 404
-    
+
     employee_name = emp_row['Employee_name']
 
-    # Check active session (PENDING or OUT)
-    cur.execute("SELECT ID, status FROM checkout WHERE Employee_no=%s AND status IN ('PENDING', 'OUT') LIMIT 1", (data['Employee_no'],))
-    existing = cur.fetchone()
+    session_token = secrets.token_hex(32)
 
-    if existing:
-        cur.close()
-        conn.close()
-        if existing['status'] == 'PENDING':
-            return jsonify({'error': 'You already have a pending checkout. Please scan at guardhouse to confirm.'}), 400
-        else:
-            return jsonify({'error': 'You already have an active checkout'}), 400
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
 
-    session_token = secrets.token_hex(32)
+        # Insert with status='PENDING', checkout_time=NULL. uq_checkout_active_employee
+        # rejects the row if the employee already has a PENDING or OUT movement.
+        try:
+            cur.execute("""
+                INSERT INTO checkout (Employee_no, Employee_name, Department, Location, Purpose, checkout_time, status, session_token, updated_at)
+                VALUES (%s, %s, %s, %s, %s, NULL, 'PENDING', %s, NOW(6))
+            """, (data['Employee_no'], employee_name, data['Department'], data['Location'], data['Purpose'], session_token))
+        except mysql.connector.IntegrityError as e:
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            cur.execute("SELECT status FROM checkout WHERE Employee_no=%s AND status IN ('PENDING', 'OUT') LIMIT 1", (data['Employee_no'],))
+            existing = cur.fetchone()
+            cur.close()
+            if existing and existing['status'] == 'PENDING':
+                return jsonify({'error': 'You already have a pending checkout. Please scan at guardhouse to confirm.'}), 400
+            else:
+                return jsonify({'error': 'You already have an active checkout'}), 400
 
-    # Insert with status='PENDING', checkout_time=NULL
-    cur.execute("""
-        INSERT INTO checkout (Employee_no, Employee_name, Department, Location, Purpose, checkout_time, status, session_token) 
-        VALUES (%s, %s, %s, %s, %s, NULL, 'PENDING', %s)
-    """, (data['Employee_no'], employee_name, data['Department'], data['Location'], data['Purpose'], session_token))
+        row_id = cur.lastrowid
+        cur.close()
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    session_index.put(session_token, data['Employee_no'], 'PENDING', row_id, datetime.now(), {
+        'Employee_name': employee_name,
+        'Department': data['Department'],
+        'Location': data['Location'],
+        'Purpose': data['Purpose']
+    })
 
     resp = make_response(jsonify({
         'success': True, 
@@ -308,7 +2321,312 @@ def checkout():
     )
     return resp
 
-def send_checkout_notification(employee_no, employee_name, department, location, purpose, checkout_time):
+class SMTPNotifier:
+    def __init__(self, workers=2, queue_size=1000, max_retries=3, backoff=2, idle_timeout=60):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._stopping = threading.Event()
+        self.counters = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'dropped': 0, 'connects': 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._last_latency = None
+        self._queue_wait_max = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"smtp-notifier-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+
+    @timed_phase('notify')
+    def enqueue(self, msg, recipients):
+        self.start()
+        try:
+            self._queue.put_nowait((msg, recipients, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.counters['dropped'] += 1
+            logging.error(f"Notification queue full ({self._queue.qsize()}), dropping '{msg['Subject']}'")
+            return False
+        with self._lock:
+            self.counters['queued'] += 1
+        return True
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        if SMTP_USE_TLS:
+            server.starttls()
+        if EMAIL_PASSWORD:
+            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        with self._lock:
+            self.counters['connects'] += 1
+        return server
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _worker(self):
+        server = None
+        while True:
+            try:
+                item = self._queue.get(timeout=1 if self._stopping.is_set() else self.idle_timeout)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                # Let idle sessions go before the relay times them out
+                if server is not None:
+                    self._close(server)
+                    server = None
+                continue
+
+            if item is None:
+                self._queue.task_done()
+                break
+
+            msg, recipients, queued_at = item
+            payload = msg.as_string()
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                reused = server is not None
+                try:
+                    if server is None:
+                        server = self._connect()
+                    server.sendmail(EMAIL_ADDRESS, recipients, payload)
+                    self._record_sent(time.monotonic() - started, started - queued_at)
+                    break
+                except Exception as e:
+                    if server is not None:
+                        self._close(server)
+                        server = None
+                    if reused and isinstance(e, smtplib.SMTPServerDisconnected):
+                        # The relay dropped our idle session; reconnect straight away
+                        continue
+                    if attempt >= self.max_retries:
+                        with self._lock:
+                            self.counters['failed'] += 1
+                        logging.error(f"Giving up on '{msg['Subject']}' after {attempt + 1} attempts: {e}")
+                        break
+                    delay = self.backoff * (2 ** attempt)
+                    attempt += 1
+                    with self._lock:
+                        self.counters['retries'] += 1
+                    logging.warning(f"Sending '{msg['Subject']}' failed ({e}), retrying in {delay}s")
+                    time.sleep(delay)
+
+            self._queue.task_done()
+
+        if server is not None:
+            self._close(server)
+
+    def _record_sent(self, latency, queue_wait):
+        metrics.observe('smtp_send_duration_seconds', (), latency)
+        metrics.observe('notification_queue_wait_seconds', (), queue_wait)
+        with self._lock:
+            self.counters['sent'] += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            self._last_latency = latency
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+
+    def shutdown(self, timeout=10):
+        # Lets queued mail drain before the process exits
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                # Never block exit on a full queue; workers stop once it is empty
+                break
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            sent = self.counters['sent']
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'workers': sum(1 for t in self._threads if t.is_alive()),
+                'avg_send_latency': round(self._latency_total / sent, 4) if sent else None,
+                'max_send_latency': round(self._latency_max, 4),
+                'last_send_latency': round(self._last_latency, 4) if self._last_latency is not None else None,
+                'max_queue_wait': round(self._queue_wait_max, 4),
+                **self.counters,
+            }
+
+notifier = None  # built by create_app()
+atexit.register(lambda: notifier.shutdown() if notifier else None)
+
+class NotificationDigest:
+    def __init__(self, enabled=False, window=300, max_events=100):
+        self.enabled = enabled
+        self.window = window
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._batches = {}  # (to, cc) -> list of event details
+        self._timers = {}
+        self.counters = {'events': 0, 'digests': 0}
+
+    def add(self, primary_recipients, cc_recipients, details):
+        key = (tuple(sorted(primary_recipients)), tuple(sorted(cc_recipients)))
+        with self._lock:
+            self.counters['events'] += 1
+            batch = self._batches.setdefault(key, [])
+            batch.append(details)
+            if len(batch) >= self.max_events:
+                flush_now = True
+            else:
+                flush_now = False
+                if key not in self._timers:
+                    timer = threading.Timer(self.window, self.flush, args=(key,))
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+        if flush_now:
+            self.flush(key)
+
+    def flush(self, key):
+        with self._lock:
+            batch = self._batches.pop(key, None)
+            timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if not batch:
+            return
+        primary_recipients, cc_recipients = key
+        try:
+            send_digest_notification(list(primary_recipients), list(cc_recipients), batch)
+            with self._lock:
+                self.counters['digests'] += 1
+        except Exception as e:
+            logging.error(f"Error sending notification digest: {e}")
+            logging.error(traceback.format_exc())
+
+    def flush_all(self):
+        with self._lock:
+            keys = list(self._batches)
+        for key in keys:
+            self.flush(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'window': self.window,
+                'pending_batches': len(self._batches),
+                'pending_events': sum(len(b) for b in self._batches.values()),
+                **self.counters,
+            }
+
+digest = NotificationDigest(
+    enabled=NOTIFY_DIGEST_ENABLED,
+    window=NOTIFY_DIGEST_WINDOW,
+    max_events=NOTIFY_DIGEST_MAX_EVENTS
+)
+# Registered after the notifier so pending digests are queued before it drains
+atexit.register(digest.flush_all)
+
+def send_digest_notification(primary_recipients, cc_recipients, events, subject=None, title='Employee Movement Digest', intro=None):
+    logging.info(f"Sending digest of {len(events)} movements to {len(primary_recipients)} primary recipients and {len(cc_recipients)} CC recipients")
+
+    def fmt(value):
+        return value.strftime('%Y-%m-%d %H:%M:%S') if value else 'N/A'
+
+    rows = "".join(f"""
+                            <tr>
+                                <td>{e['type']}</td>
+                                <td>{e['employee_no']}</td>
+                                <td>{e['employee_name']}</td>
+                                <td>{e['department']}</td>
+                                <td>{e['location']}</td>
+                                <td>{e['purpose']}</td>
+                                <td>{fmt(e['checkout_time'])}</td>
+                                <td>{fmt(e['checkin_time'])}</td>
+                                <td>{e['duration'] or 'N/A'}</td>
+                            </tr>""" for e in events)
+
+    checkouts = sum(1 for e in events if e['type'] == 'Check Out')
+    checkins = len(events) - checkouts
+
+    subject = subject or f"Movement Digest: {checkouts} Check Out, {checkins} Check In"
+    intro = intro or f"The following movements were recorded in the last {NOTIFY_DIGEST_WINDOW // 60} minutes:"
+
+    html_body = f"""
+        <html>
+            <head>
+                <style>
+                    body {{ font-family: Arial, sans-serif; }}
+                    .container {{ max-width: 900px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px; }}
+                    .header {{ background-color: #4e73df; color: white; padding: 15px; border-radius: 5px 5px 0 0; }}
+                    .content {{ padding: 20px; background-color: #f9f9f9; }}
+                    table {{ width: 100%; border-collapse: collapse; font-size: 13px; background-color: white; }}
+                    th {{ background-color: #4e73df; color: white; padding: 8px; text-align: left; }}
+                    td {{ padding: 8px; border-bottom: 1px solid #eee; color: #333; }}
+                    .footer {{ margin-top: 20px; padding: 10px; font-size: 12px; color: #999; text-align: center; }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <h2 style="margin: 0;">{title}</h2>
+                    </div>
+                    <div class="content">
+                        <p>{intro}</p>
+                        <table>
+                            <tr>
+                                <th>Type</th>
+                                <th>Employee No</th>
+                                <th>Employee Name</th>
+                                <th>Department</th>
+                                <th>Location</th>
+                                <th>Purpose</th>
+                                <th>Checkout Time</th>
+                                <th>Check-in Time</th>
+                                <th>Duration</th>
+                            </tr>{rows}
+                        </table>
+                    </div>
+                    <div class="footer">
+                        <p>This is a system-generated email. Please do not reply.</p>
+                    </div>
+                </div>
+            </body>
+        </html>
+        """
+
+    msg = MIMEMultipart('alternative')
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = ', '.join(primary_recipients) if primary_recipients else EMAIL_ADDRESS
+    msg['Cc'] = ', '.join(cc_recipients)
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(html_body, 'html'))
+
+    return notifier.enqueue(msg, primary_recipients + cc_recipients)
+
+def send_checkout_notification(employee_no, employee_name, department, location, purpose, checkout_time, critical=False):
     try:
         primary_recipients = []
         
@@ -329,6 +2647,20 @@ def send_checkout_notification(employee_no, employee_name, department, location,
         if not primary_recipients and not cc_recipients:
             logging.warning("No recipients found for checkout notification")
             return False
+
+        if digest.enabled and not critical and department not in NOTIFY_IMMEDIATE_DEPARTMENTS:
+            digest.add(primary_recipients, cc_recipients, {
+                'type': 'Check Out',
+                'employee_no': employee_no,
+                'employee_name': employee_name,
+                'department': department,
+                'location': location,
+                'purpose': purpose,
+                'checkout_time': checkout_time,
+                'checkin_time': None,
+                'duration': None
+            })
+            return True
         
         logging.info(f"Sending checkout notification to {len(primary_recipients)} primary recipients and {len(cc_recipients)} CC recipients")
     
@@ -407,13 +2739,11 @@ def send_checkout_notification(employee_no, employee_name, department, location,
         
         all_recipients = primary_recipients + cc_recipients
         
-        # Send email
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ADDRESS, all_recipients, msg.as_string())
+        # Hand over to the notification workers
+        if not notifier.enqueue(msg, all_recipients):
+            return False
         
-        logging.info(f"Checkout notification sent successfully - To: {len(primary_recipients)}, CC: {len(cc_recipients)} for {employee_name}")
+        logging.info(f"Checkout notification queued - To: {len(primary_recipients)}, CC: {len(cc_recipients)} for {employee_name}")
         return True
         
     except Exception as e:
@@ -427,56 +2757,70 @@ def confirm_checkout():
     
     if not token:
         return jsonify({'error': 'No session found. Please pre-register from your workstation first.'}), 400
+
+    if app.config['GUARDHOUSE_MODE'] == 'journal':
+        resp = journal_confirm_checkout(token)
+        if resp is not None:
+            return resp
     
-    conn = get_conn()
-    if not conn:
-        return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
+    with db_conn() as conn:
+        if not conn:
+            if app.config['GUARDHOUSE_MODE'] == 'fallback':
+                resp = journal_confirm_checkout(token)
+                if resp is not None:
+                    return resp
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
+
+        # A PENDING index entry already carries everything the response needs, so
+        # the common case is a single guarded UPDATE
+        entry = session_index.get(token)
+        if entry and entry['status'] == 'PENDING' and entry['details']:
+            row = {'ID': entry['ID'], 'Employee_no': entry['Employee_no'], **entry['details']}
+        else:
+            cur.execute("""
+                SELECT ID, Employee_no, Employee_name, Department, Location, Purpose 
+                FROM checkout 
+                WHERE session_token=%s AND status='PENDING' 
+                LIMIT 1
+            """, (token,))
+            row = cur.fetchone()
     
-    cur.execute("""
-        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose 
-        FROM checkout 
-        WHERE session_token=%s AND status='PENDING' 
-        LIMIT 1
-    """, (token,))
-    row = cur.fetchone()
+            if not row:
+                cur.close()
+                return jsonify({'error': 'No pending checkout found or already confirmed'}), 404
+
+        checkout_time = datetime.now().replace(microsecond=0)
+
+        # Only one confirmation can move the row out of PENDING
+        cur.execute("""
+            UPDATE checkout 
+            SET checkout_time=%s, status='OUT', updated_at=NOW(6) 
+            WHERE ID=%s AND session_token=%s AND status='PENDING'
+        """, (checkout_time, row['ID'], token))
+        updated = cur.rowcount
     
-    if not row:
         cur.close()
-        conn.close()
+
+    if not updated:
+        session_index.remove_token(token)
         return jsonify({'error': 'No pending checkout found or already confirmed'}), 404
+
+    session_index.put(token, row['Employee_no'], 'OUT', row['ID'], checkout_time, movement_details(row))
+
+    publish_event('checkout-confirmed', format_movement_row({
+        **row, 'checkout_time': checkout_time, 'checkin_time': None, 'status': 'OUT'
+    }))
     
-    # Update checkout time and status
-    cur.execute("""
-        UPDATE checkout 
-        SET checkout_time=NOW(), status='OUT' 
-        WHERE ID=%s
-    """, (row['ID'],))
-    
-    conn.commit()
-    
-    # Get the updated checkout time
-    cur.execute("SELECT checkout_time FROM checkout WHERE ID=%s", (row['ID'],))
-    checkout_time_row = cur.fetchone()
-    checkout_time = checkout_time_row['checkout_time'] if checkout_time_row else None
-    
-    cur.close()
-    conn.close()
-    
-    # Send email notification in background thread (non-blocking)
-    email_thread = threading.Thread(
-        target=send_checkout_notification,
-        args=(
-            row['Employee_no'],
-            row['Employee_name'],
-            row['Department'],
-            row['Location'],
-            row['Purpose'],
-            checkout_time
-        ),
-        daemon=True  # Thread will close when main program exits
+    # Queue email notification (sent by the notifier workers)
+    send_checkout_notification(
+        row['Employee_no'],
+        row['Employee_name'],
+        row['Department'],
+        row['Location'],
+        row['Purpose'],
+        checkout_time
     )
-    email_thread.start()
     
     # Return response immediately without waiting for email
     return jsonify({
@@ -488,7 +2832,45 @@ def confirm_checkout():
         'Purpose': row['Purpose']
     })
 
-def send_checkin_notification(employee_no, employee_name, department, location, purpose, checkout_time, checkin_time, duration):
+def journal_confirm_checkout(token):
+    # Confirms from the session index without touching MySQL; None means the
+    # index does not know this session and the normal path has to decide
+    entry = session_index.get(token, allow_stale=True)
+    if not entry or entry['status'] != 'PENDING' or not entry['details']:
+        return None
+    if entry['since'] and entry['since'] < pending_expiry_cutoff():
+        session_index.remove_token(token)
+        return jsonify({'error': 'No pending checkout found or already confirmed'}), 404
+
+    checkout_time = datetime.now().replace(microsecond=0)
+    guardhouse_journal.record('confirm', token, entry['ID'], entry['Employee_no'], checkout_time, entry['details'])
+    session_index.put(token, entry['Employee_no'], 'OUT', entry['ID'], checkout_time, entry['details'])
+
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'Employee_no': entry['Employee_no'],
+        **entry['details']
+    })
+
+def journal_checkin(token, employee_no):
+    entry = session_index.get(token, allow_stale=True) if token else None
+    if not entry or entry['status'] != 'OUT' or entry['Employee_no'] != employee_no or not entry['details']:
+        return None
+
+    checkin_time = datetime.now().replace(microsecond=0)
+    checkout_time = entry['since']
+    guardhouse_journal.record('checkin', token, entry['ID'], employee_no, checkin_time, {
+        **entry['details'],
+        'checkout_time': checkout_time.strftime('%Y-%m-%d %H:%M:%S') if checkout_time else None
+    })
+    session_index.remove_by_id(entry['ID'])
+
+    resp = make_response(jsonify({'success': True, 'queued': True, 'duration': format_duration(checkout_time, checkin_time)}))
+    resp.delete_cookie('checkout_session')
+    return resp
+
+def send_checkin_notification(employee_no, employee_name, department, location, purpose, checkout_time, checkin_time, duration, critical=False):
     try:
         primary_recipients = []
         
@@ -509,6 +2891,24 @@ def send_checkin_notification(employee_no, employee_name, department, location,
         if not primary_recipients and not cc_recipients:
             logging.warning("No recipients found for checkin notification")
             return False
+
+        # Long absences are always reported straight away
+        if checkout_time and checkin_time and checkin_time - checkout_time >= timedelta(hours=NOTIFY_CRITICAL_HOURS):
+            critical = True
+
+        if digest.enabled and not critical and department not in NOTIFY_IMMEDIATE_DEPARTMENTS:
+            digest.add(primary_recipients, cc_recipients, {
+                'type': 'Check In',
+                'employee_no': employee_no,
+                'employee_name': employee_name,
+                'department': department,
+                'location': location,
+                'purpose': purpose,
+                'checkout_time': checkout_time,
+                'checkin_time': checkin_time,
+                'duration': duration
+            })
+            return True
         
         logging.info(f"Sending checkin notification to {len(primary_recipients)} primary recipients and {len(cc_recipients)} CC recipients")
     
@@ -598,13 +2998,11 @@ def send_checkin_notification(employee_no, employee_name, department, location,
         
         all_recipients = primary_recipients + cc_recipients
         
-        # Send email
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ADDRESS, all_recipients, msg.as_string())
+        # Hand over to the notification workers
+        if not notifier.enqueue(msg, all_recipients):
+            return False
         
-        logging.info(f"Check-in notification sent successfully - To: {len(primary_recipients)}, CC: {len(cc_recipients)} for {employee_name}")
+        logging.info(f"Check-in notification queued - To: {len(primary_recipients)}, CC: {len(cc_recipients)} for {employee_name}")
         return True
         
     except Exception as e:
@@ -614,76 +3012,291 @@ def send_checkin_notification(employee_no, employee_name, department, location,
 
 @app.route('/checkin/<employee_no>', methods=['PUT'])
 def checkin(employee_no):
-    conn = get_conn()
-    if not conn:
-        return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
+    token = request.cookies.get('checkout_session')
+    if app.config['GUARDHOUSE_MODE'] == 'journal':
+        resp = journal_checkin(token, employee_no)
+        if resp is not None:
+            return resp
 
-    cur.execute("""
-        SELECT ID, Employee_name, Department, Location, Purpose, checkout_time 
-        FROM checkout WHERE Employee_no=%s AND status='OUT' LIMIT 1
-    """, (employee_no,))
+    with db_conn() as conn:
+        if not conn:
+            if app.config['GUARDHOUSE_MODE'] == 'fallback':
+                resp = journal_checkin(token, employee_no)
+                if resp is not None:
+                    return resp
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
 
-    row = cur.fetchone()
+        cur.execute("""
+            SELECT ID, Employee_name, Department, Location, Purpose, checkout_time 
+            FROM checkout WHERE Employee_no=%s AND status='OUT' LIMIT 1
+        """, (employee_no,))
+
+        row = cur.fetchone()
+
+        if not row:
+            cur.close()
+            return jsonify({'error': 'No active checkout found or already checked-in'}), 403
+    
+        checkin_time = datetime.now().replace(microsecond=0)
+
+        # Guarded so a concurrent check-in of the same movement cannot apply twice
+        with rollup_lock(conn) as locked:
+            cur.execute("""
+                UPDATE checkout 
+                SET checkin_time=%s, status='IN', updated_at=NOW(6) 
+                WHERE ID=%s AND status='OUT'
+            """, (checkin_time, row['ID']))
+            updated = cur.rowcount
+            if updated:
+                record_rollup(cur, [(employee_no, row['Department'], row['checkout_time'], checkin_time)], locked)
 
-    if not row:
         cur.close()
-        conn.close()
+
+    if not updated:
         return jsonify({'error': 'No active checkout found or already checked-in'}), 403
-    
-    cur.execute("UPDATE checkout SET checkin_time=NOW(), status='IN' WHERE ID=%s", (row['ID'],))
-    conn.commit()
 
-    cur.execute(
-        "SELECT checkout_time, checkin_time FROM checkout WHERE ID=%s",
-        (row['ID'],)
-    )
-    times = cur.fetchone()
-    
-    duration = None
-    if times and times['checkout_time'] and times['checkin_time']:
-        seconds = int((times['checkin_time'] - times['checkout_time']).total_seconds())
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        duration = f"{hours}h {minutes}m"
+    checkout_time = row['checkout_time']
+    duration = format_duration(checkout_time, checkin_time)
 
-    cur.close()
-    conn.close()
-
-    email_thread = threading.Thread(
-        target=send_checkin_notification,
-        args=(
-            employee_no,
-            row['Employee_name'],
-            row['Department'],
-            row['Location'],
-            row['Purpose'],
-            times['checkout_time'] if times else None,
-            times['checkin_time'] if times else None,
-            duration
-        ),
-        daemon=True
+    session_index.remove_by_id(row['ID'])
+
+    publish_event('check-in', format_movement_row({
+        **row,
+        'Employee_no': employee_no,
+        'checkin_time': checkin_time,
+        'status': 'IN'
+    }))
+
+    send_checkin_notification(
+        employee_no,
+        row['Employee_name'],
+        row['Department'],
+        row['Location'],
+        row['Purpose'],
+        checkout_time,
+        checkin_time,
+        duration
     )
-    email_thread.start()
 
     resp = make_response(jsonify({'success': True, 'duration': duration}))
     resp.delete_cookie('checkout_session')
     return resp
 
+def parse_group_request(data):
+    # Employee numbers in request order without duplicates, or None if malformed
+    employee_nos = data.get('Employee_nos') if data else None
+    if not isinstance(employee_nos, list) or not employee_nos:
+        return None
+    if not all(isinstance(no, str) and no.strip() for no in employee_nos):
+        return None
+    return list(dict.fromkeys(no.strip() for no in employee_nos))
+
+def send_group_notification(movement_type, movements):
+    # One email per department for the whole group instead of one per employee
+    by_department = {}
+    for m in movements:
+        by_department.setdefault(m['department'], []).append(m)
+
+    for department, events in by_department.items():
+        try:
+            primary_recipients = list(set(DEPARTMENT_EMAIL_MAPPING.get(department, [])))
+            if not primary_recipients:
+                logging.warning(f"Department {department} not found in email mapping")
+            cc_recipients = list(set(HR_NOTIFICATION_EMAIL + OPERATION_MANAGER_EMAIL))
+            send_digest_notification(
+                primary_recipients,
+                cc_recipients,
+                events,
+                subject=f"Group {movement_type} Notification: {len(events)} employees ({department})",
+                title=f"Group {movement_type} Notification",
+                intro=f"{len(events)} employees from {department} were recorded as a group {movement_type.lower()}:"
+            )
+        except Exception as e:
+            logging.error(f"Error sending group {movement_type.lower()} notification for {department}: {e}")
+            logging.error(traceback.format_exc())
+
+@app.route('/group-checkout', methods=['POST'])
+def group_checkout():
+    # Checks out a whole team at the guardhouse: every row is created as OUT
+    # in one transaction, or none is
+    data = request.json
+    employee_nos = parse_group_request(data)
+    if not employee_nos or not all(data.get(k) for k in ('Location', 'Purpose')):
+        return jsonify({'error': 'Missing fields'}), 400
+    if len(employee_nos) > app.config['GROUP_MAX_SIZE']:
+        return jsonify({'error': f"At most {app.config['GROUP_MAX_SIZE']} employees per group"}), 400
+
+    placeholders = ', '.join(['%s'] * len(employee_nos))
+
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
+
+        cur.execute(f"""
+            SELECT Employee_no, Employee_name, Department 
+            FROM employee 
+            WHERE Employee_no IN ({placeholders})
+        """, employee_nos)
+        employees = {row['Employee_no']: row for row in cur.fetchall()}
+        missing = [no for no in employee_nos if no not in employees]
+        if missing:
+            cur.close()
+            return jsonify({'error': 'Employee not found', 'Employee_nos': missing}), 404
+
+        cur.execute(f"""
+            SELECT Employee_no 
+            FROM checkout 
+            WHERE Employee_no IN ({placeholders}) AND status IN ('PENDING', 'OUT')
+        """, employee_nos)
+        active = [row['Employee_no'] for row in cur.fetchall()]
+        if active:
+            cur.close()
+            return jsonify({'error': 'Some employees already have a pending or active checkout', 'Employee_nos': active}), 400
+
+        checkout_time = datetime.now().replace(microsecond=0)
+
+        try:
+            conn.start_transaction()
+            cur.executemany("""
+                INSERT INTO checkout (Employee_no, Employee_name, Department, Location, Purpose, checkout_time, status, session_token, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, 'OUT', NULL, NOW(6))
+            """, [
+                (no, employees[no]['Employee_name'], employees[no]['Department'], data['Location'], data['Purpose'], checkout_time)
+                for no in employee_nos
+            ])
+            cur.execute(f"""
+                SELECT ID, Employee_no 
+                FROM checkout 
+                WHERE Employee_no IN ({placeholders}) AND status='OUT'
+            """, employee_nos)
+            ids = {row['Employee_no']: row['ID'] for row in cur.fetchall()}
+            conn.commit()
+        except mysql.connector.IntegrityError as e:
+            conn.rollback()
+            cur.close()
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            # Someone in the group pre-registered while this request was running
+            return jsonify({'error': 'Some employees already have a pending or active checkout'}), 400
+
+        cur.close()
+
+    movements = [{
+        'ID': ids.get(no),
+        'Employee_no': no,
+        'Employee_name': employees[no]['Employee_name'],
+        'Department': employees[no]['Department'],
+        'Location': data['Location'],
+        'Purpose': data['Purpose'],
+        'checkout_time': checkout_time,
+        'checkin_time': None,
+        'status': 'OUT'
+    } for no in employee_nos]
+
+    publish_events('checkout-confirmed', [format_movement_row(m) for m in movements])
+    send_group_notification('Check Out', [{
+        'type': 'Check Out',
+        'employee_no': m['Employee_no'],
+        'employee_name': m['Employee_name'],
+        'department': m['Department'],
+        'location': m['Location'],
+        'purpose': m['Purpose'],
+        'checkout_time': checkout_time,
+        'checkin_time': None,
+        'duration': None
+    } for m in movements])
+
+    logging.info(f"Group checkout of {len(movements)} employees to {data['Location']}")
+    return jsonify({
+        'success': True,
+        'count': len(movements),
+        'checkout_time': format_timestamp(checkout_time),
+        'movements': [format_movement_row(m) for m in movements]
+    })
+
+@app.route('/group-checkin', methods=['POST'])
+def group_checkin():
+    employee_nos = parse_group_request(request.json)
+    if not employee_nos:
+        return jsonify({'error': 'Missing fields'}), 400
+    if len(employee_nos) > app.config['GROUP_MAX_SIZE']:
+        return jsonify({'error': f"At most {app.config['GROUP_MAX_SIZE']} employees per group"}), 400
+
+    placeholders = ', '.join(['%s'] * len(employee_nos))
+
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
+
+        cur.execute(f"""
+            SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time 
+            FROM checkout 
+            WHERE Employee_no IN ({placeholders}) AND status='OUT'
+        """, employee_nos)
+        rows = {row['Employee_no']: row for row in cur.fetchall()}
+        not_out = [no for no in employee_nos if no not in rows]
+        if not_out:
+            cur.close()
+            return jsonify({'error': 'No active checkout found or already checked-in', 'Employee_nos': not_out}), 403
+
+        checkin_time = datetime.now().replace(microsecond=0)
+        row_ids = [row['ID'] for row in rows.values()]
+
+        # One guarded statement; a short rowcount means someone else checked a
+        # member in meanwhile, and the whole group is rolled back
+        with rollup_lock(conn) as locked:
+            conn.start_transaction()
+            cur.execute(f"""
+                UPDATE checkout 
+                SET checkin_time=%s, status='IN', updated_at=NOW(6) 
+                WHERE ID IN ({', '.join(['%s'] * len(row_ids))}) AND status='OUT'
+            """, (checkin_time, *row_ids))
+            if cur.rowcount != len(row_ids):
+                conn.rollback()
+                cur.close()
+                return jsonify({'error': 'Some employees were checked in by another request, please retry'}), 409
+            conn.commit()
+            record_rollup(cur, [(no, row['Department'], row['checkout_time'], checkin_time) for no, row in rows.items()], locked)
+        cur.close()
+
+    for row_id in row_ids:
+        session_index.remove_by_id(row_id)
+
+    movements = [{**rows[no], 'checkin_time': checkin_time, 'status': 'IN'} for no in employee_nos]
+    publish_events('check-in', [format_movement_row(m) for m in movements])
+    send_group_notification('Check In', [{
+        'type': 'Check In',
+        'employee_no': m['Employee_no'],
+        'employee_name': m['Employee_name'],
+        'department': m['Department'],
+        'location': m['Location'],
+        'purpose': m['Purpose'],
+        'checkout_time': m['checkout_time'],
+        'checkin_time': checkin_time,
+        'duration': format_duration(m['checkout_time'], checkin_time)
+    } for m in movements])
+
+    logging.info(f"Group check-in of {len(movements)} employees")
+    return jsonify({
+        'success': True,
+        'count': len(movements),
+        'checkin_time': format_timestamp(checkin_time),
+        'movements': [{**format_movement_row(m), 'duration': format_duration(m['checkout_time'], checkin_time)} for m in movements]
+    })
+
 @app.route('/session-status', methods=['GET'])
 def session_status():
     token = request.cookies.get('checkout_session')
     if not token:
         return jsonify({'active': False})
     
-    conn = get_conn()
-    if not conn:
+    try:
+        row = lookup_session(token)
+    except DatabaseUnavailable:
         return jsonify({'active': False})
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT Employee_no, status FROM checkout WHERE session_token=%s AND status IN ('PENDING', 'OUT') LIMIT 1", (token,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
 
     if row:
         return jsonify({
@@ -693,22 +3306,28 @@ def session_status():
         })
     return jsonify({'active': False})
 
+def fetch_active_checkout(employee_no):
+    with db_conn() as conn:
+        if not conn:
+            raise DatabaseUnavailable()
+        cur = conn.cursor(dictionary=True)
+    
+        cur.execute("""
+            SELECT Employee_no, Employee_name, Department, Location, Purpose, checkout_time 
+            FROM checkout 
+            WHERE Employee_no=%s AND status='OUT' 
+            LIMIT 1
+        """, (employee_no,))
+        row = cur.fetchone()
+        cur.close()
+    return row
+
 @app.route('/checkout-status/<employee_no>', methods=['GET'])
 def checkout_status(employee_no):
-    conn = get_conn()
-    if not conn:
+    try:
+        row = single_flight.do('checkout_status', employee_no, lambda: fetch_active_checkout(employee_no))
+    except DatabaseUnavailable:
         return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
-    
-    cur.execute("""
-        SELECT Employee_no, Employee_name, Department, Location, Purpose, checkout_time 
-        FROM checkout 
-        WHERE Employee_no=%s AND status='OUT' 
-        LIMIT 1
-    """, (employee_no,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
     
     if row:
         return jsonify({
@@ -718,75 +3337,336 @@ def checkout_status(employee_no):
             'Department': row['Department'],
             'Location': row['Location'],
             'Purpose': row['Purpose'],
-            'checkout_time': row['checkout_time'].strftime('%Y-%m-%d %H:%M:%S') if row['checkout_time'] else None
+            'checkout_time': format_timestamp(row['checkout_time'])
         })
     return jsonify({'active': False})
 
+def build_history_filters(args):
+    # Turns the HR history filters into sargable WHERE clauses on checkout_time
+    clauses = []
+    params = []
+
+    month = args.get('month')
+    if month:
+        start = datetime.strptime(month, '%Y-%m')
+        end = datetime(start.year + (start.month // 12), start.month % 12 + 1, 1)
+        clauses.append("checkout_time >= %s AND checkout_time < %s")
+        params.extend([start, end])
+
+    date = args.get('date')
+    if date:
+        start = datetime.strptime(date, '%Y-%m-%d')
+        clauses.append("checkout_time >= %s AND checkout_time < %s")
+        params.extend([start, start + timedelta(days=1)])
+
+    employee = args.get('employee', '').strip()
+    if employee:
+        escaped = employee.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("Employee_name LIKE %s")
+        params.append(f"%{escaped}%")
+
+    date_from = args.get('from')
+    if date_from:
+        clauses.append("checkout_time >= %s")
+        params.append(datetime.strptime(date_from, '%Y-%m-%d'))
+
+    date_to = args.get('to')
+    if date_to:
+        clauses.append("checkout_time < %s")
+        params.append(datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+
+    department = args.get('department')
+    if department:
+        clauses.append("Department=%s")
+        params.append(department)
+
+    return clauses, params
+
+def reaches_archive(args):
+    # True when the requested date range may include rows older than archive_cutoff()
+    lower = None
+    if args.get('month'):
+        lower = datetime.strptime(args['month'], '%Y-%m')
+    if args.get('date'):
+        lower = max(lower or datetime.min, datetime.strptime(args['date'], '%Y-%m-%d'))
+    if args.get('from'):
+        lower = max(lower or datetime.min, datetime.strptime(args['from'], '%Y-%m-%d'))
+    return lower is None or lower < archive_cutoff()
+
+def encode_history_cursor(row):
+    return f"{row['checkout_time'].strftime('%Y%m%d%H%M%S')}-{row['ID']}"
+
+def decode_history_cursor(cursor):
+    checkout_time, row_id = cursor.split('-', 1)
+    return datetime.strptime(checkout_time, '%Y%m%d%H%M%S'), int(row_id)
+
+def encode_change_cursor(version):
+    return version.strftime('%Y-%m-%dT%H:%M:%S.%f') if version else '0'
+
+def decode_change_cursor(cursor):
+    if cursor == '0':
+        return datetime.min
+    return datetime.strptime(cursor, '%Y-%m-%dT%H:%M:%S.%f')
+
+def compact_rows(rows):
+    # Column names once, each row as an array; timestamps as epoch seconds
+    # (decoded by the templates' decodeRows())
+    columns = list(rows[0]) if rows else []
+    time_columns = [i for i, column in enumerate(columns) if column in ('checkout_time', 'checkin_time')]
+    values = []
+    for row in rows:
+        row = list(row.values())
+        for i in time_columns:
+            if row[i]:
+                row[i] = db_time(row[i]).timestamp()
+        values.append(row)
+    return {'columns': columns, 'rows': values}
+
+def json_response(payload):
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), default=datetime.isoformat)
+    return app.response_class(body, mimetype='application/json')
+
+def make_history_etag(version, is_hr, args):
+    # The change cursor itself is left out so successive delta polls share an ETag
+    view = sorted((k, v) for k, v in args.items(multi=True) if k != 'since')
+    return hashlib.sha1(f"{encode_change_cursor(version)}|{is_hr}|{view}".encode()).hexdigest()
+
 @app.route('/checkout-history', methods=['GET'])
 def checkout_history():
     try:
-        conn = get_conn()
-        if not conn:
-            return jsonify({'error': 'DB connection failed'}), 500
-        cur = conn.cursor(dictionary=True)
-
         is_hr = session.get('hr_logged_in', False)
-        
-        if is_hr:
-            cur.execute("""
-                SELECT Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
-                FROM checkout 
-                WHERE status IN ('OUT', 'IN') 
-                ORDER BY checkout_time DESC
-            """)
+        since = request.args.get('since')
+        clauses = []
+        params = []
+
+        try:
+            if since:
+                since_time = decode_change_cursor(since)
+
+            if is_hr:
+                clauses, params = build_history_filters(request.args)
+                limit = min(
+                    int(request.args.get('limit', app.config['HISTORY_PAGE_SIZE'])),
+                    app.config['HISTORY_MAX_PAGE_SIZE']
+                )
+                cursor = request.args.get('cursor')
+                if cursor and not since:
+                    cursor_time, cursor_id = decode_history_cursor(cursor)
+                    clauses.append("(checkout_time < %s OR (checkout_time = %s AND ID < %s))")
+                    params.extend([cursor_time, cursor_time, cursor_id])
+                if limit < 1:
+                    raise ValueError(limit)
+        except ValueError:
+            return jsonify({'error': 'Invalid filter or cursor'}), 400
+
+        with db_conn() as conn:
+            if not conn:
+                return jsonify({'error': 'DB connection failed'}), 500
+            cur = conn.cursor(dictionary=True)
+
+            cur.execute("SELECT MAX(updated_at) AS version FROM checkout")
+            version = cur.fetchone()['version']
+            etag = make_history_etag(version, is_hr, request.args)
+
+            if since and request.if_none_match.contains(etag):
+                cur.close()
+                resp = make_response('', 304)
+                resp.set_etag(etag)
+                resp.headers['X-Change-Cursor'] = encode_change_cursor(version)
+                return resp
+
+            if since:
+                # Rows that left the OUT state are included so clients can drop them.
+                # The overlap re-sends rows whose transactions committed late.
+                overlap = timedelta(seconds=app.config['HISTORY_DELTA_OVERLAP_SECONDS'])
+                delta_limit = app.config['HISTORY_MAX_PAGE_SIZE']
+                where = " AND ".join(["status IN ('OUT', 'IN')", "updated_at > %s"] + clauses)
+                # Only HR sees completed movements; other callers get their IDs below
+                checkin_column = " checkin_time," if is_hr else ""
+                cur.execute(f"""
+                    SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time,{checkin_column} status
+                    FROM checkout 
+                    WHERE {where}
+                    ORDER BY updated_at
+                    LIMIT %s
+                """, (max(since_time, datetime.min + overlap) - overlap, *params, delta_limit + 1))
+            elif is_hr:
+                # Fetch one extra row to know whether another page exists
+                where = " AND ".join(["status IN ('OUT', 'IN')"] + clauses)
+                cur.execute(f"""
+                    SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+                    FROM checkout 
+                    WHERE {where}
+                    ORDER BY checkout_time DESC, ID DESC
+                    LIMIT %s
+                """, (*params, limit + 1))
+
+                # Archived rows all sort after the archive cutoff, so the archive is
+                # only read once the page runs past it (or past the end of the hot set)
+                hot_rows = cur.fetchall()
+                if reaches_archive(request.args) and (
+                    len(hot_rows) <= limit or hot_rows[-1]['checkout_time'] < archive_cutoff()
+                ):
+                    cur.execute(f"""
+                        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+                        FROM checkout_archive 
+                        WHERE {where}
+                        ORDER BY checkout_time DESC, ID DESC
+                        LIMIT %s
+                    """, (*params, limit + 1))
+                    hot_rows.extend(cur.fetchall())
+                    hot_rows.sort(key=lambda row: (row['checkout_time'], row['ID']), reverse=True)
+                    hot_rows = hot_rows[:limit + 1]
+            else:
+                cur.execute("""
+                    SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, status
+                    FROM checkout 
+                    WHERE status='OUT' 
+                    ORDER BY checkout_time DESC
+                """)
+
+            rows = hot_rows if is_hr and not since else cur.fetchall()
+            cur.close()
+
+        next_cursor = None
+        truncated = False
+        if since and len(rows) > delta_limit:
+            # Too much changed; the client should reload instead of merging
+            rows = []
+            truncated = True
+        elif not since and is_hr and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1])
+
+        # The public dashboard only needs to know which rows left OUT
+        removed = None
+        if since and not is_hr:
+            removed = [row['ID'] for row in rows if row['status'] != 'OUT']
+            rows = [row for row in rows if row['status'] == 'OUT']
+
+        if request.args.get('format') == 'compact':
+            with timed_phase('format'):
+                payload = compact_rows(rows)
+                if removed is not None:
+                    payload['removed'] = removed
+            with timed_phase('serialize'):
+                resp = json_response(payload)
         else:
-            cur.execute("""
-                SELECT Employee_no, Employee_name, Department, Location, Purpose, checkout_time
-                FROM checkout 
-                WHERE status='OUT' 
-                ORDER BY checkout_time DESC
-            """)
-
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        for row in rows:
-            if row.get('checkout_time'):
-                row['checkout_time'] = row['checkout_time'].strftime('%Y-%m-%d %H:%M:%S')
-            if row.get('checkin_time'):
-                row['checkin_time'] = row['checkin_time'].strftime('%Y-%m-%d %H:%M:%S')
-        
-        return jsonify(rows)
+            with timed_phase('format'):
+                for row in rows:
+                    if row.get('checkout_time'):
+                        row['checkout_time'] = format_timestamp(row['checkout_time'])
+                    if row.get('checkin_time'):
+                        row['checkin_time'] = format_timestamp(row['checkin_time'])
+
+            with timed_phase('serialize'):
+                resp = make_response(jsonify(rows if removed is None else {'rows': rows, 'removed': removed}))
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.headers['X-Change-Cursor'] = encode_change_cursor(version)
+        if next_cursor:
+            resp.headers['X-Next-Cursor'] = next_cursor
+        if truncated:
+            resp.headers['X-Delta-Truncated'] = '1'
+        return resp
     
     except Exception as e:
         logging.error(f"checkout_history error: {str(e)}")
         logging.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/events', methods=['GET'])
+def events():
+    if not app.config['EVENTS_STREAMING']:
+        # 204 tells EventSource to stop reconnecting
+        return '', 204
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    if app.config['EVENTS_BACKEND'] != 'local':
+        start_event_relay()
+
+    # Subscribe before reading the backlog so nothing published in between is lost
+    q = event_broker.subscribe()
+    backlog = []
+    reset = False
+    if last_event_id is not None:
+        backlog = event_broker.replay(last_event_id)
+        if backlog is None and app.config['EVENTS_BACKEND'] != 'local':
+            backlog = load_events_since(last_event_id)
+        if backlog is None:
+            backlog = []
+            reset = True
+    else:
+        last_event_id = event_broker.last_id
+
+    heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+
+    def generate():
+        sent_id = last_event_id
+        try:
+            yield "retry: 5000\n\n"
+            if reset:
+                # Too far behind to replay; the client should reload its data
+                yield format_sse(event_broker.last_id, 'reset', {})
+                sent_id = event_broker.last_id
+            for event_id, event, data in backlog:
+                if event_id > sent_id:
+                    yield format_sse(event_id, event, data)
+                    sent_id = event_id
+            while True:
+                try:
+                    item = q.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    break
+                event_id, event, data = item
+                if event_id > sent_id:
+                    yield format_sse(event_id, event, data)
+                    sent_id = event_id
+        finally:
+            event_broker.unsubscribe(q)
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/hr-login', methods=['POST'])
 def hr_login():
     data = request.json
     if not data or 'username' not in data or 'password' not in data:
         return jsonify({'error': 'Missing credentials'}), 400
     
-    conn = get_conn()
-    if not conn:
-        return jsonify({'error': 'DB connection failed'}), 500
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
     
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT username, password, department
-        FROM auth_user
-        WHERE username=%s
-            AND password=%s
-            AND department=%s
-        LIMIT 1
-    """, (data['username'], data['password'], 'HR'))
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT username, password, department
+            FROM auth_user
+            WHERE username=%s
+                AND password=%s
+                AND department=%s
+            LIMIT 1
+        """, (data['username'], data['password'], 'HR'))
     
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+        user = cur.fetchone()
+        cur.close()
     
     if user:
         session['hr_logged_in'] = True
@@ -803,41 +3683,330 @@ def hr_history():
         return redirect(url_for('dashboard_page'))
     
     # Return HR history page here
-    return render_template('hr_history.html')
+    return render_template('hr_history.html', live_events=app.config['EVENTS_STREAMING'])
+
+@app.route('/analytics', methods=['GET'])
+def analytics():
+    # Time-away statistics from movement_rollup; cost depends on the number of
+    # days asked for, not on the size of checkout
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+
+    group = request.args.get('group', 'day')
+    if group not in ('day', 'department', 'employee'):
+        return jsonify({'error': 'group must be day, department or employee'}), 400
+    department = request.args.get('department')
+    employee = request.args.get('employee')
+
+    try:
+        end_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else datetime.now().date()
+        start_day = (
+            datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+            else end_day - timedelta(days=app.config['ANALYTICS_DEFAULT_DAYS'] - 1)
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid filter'}), 400
+    if start_day > end_day:
+        return jsonify({'error': 'Invalid filter'}), 400
+
+    clauses = ["day >= %s", "day < %s"]
+    params = [start_day, end_day + timedelta(days=1)]
+    if employee:
+        clauses.append("Employee_no=%s")
+        params.append(employee)
+        if department:
+            clauses.append("Department=%s")
+            params.append(department)
+    elif group == 'employee':
+        clauses.append("Employee_no <> '*'")
+        if department:
+            clauses.append("Department=%s")
+            params.append(department)
+    elif group == 'department':
+        clauses.append("Department <> '*' AND Employee_no = '*'")
+    elif department:
+        clauses.append("Department=%s AND Employee_no = '*'")
+        params.append(department)
+    else:
+        clauses.append("Department = '*' AND Employee_no = '*'")
+
+    key = {'day': 'day', 'department': 'Department', 'employee': 'Employee_no'}[group]
+    order = "day" if group == 'day' else "total_seconds DESC"
+    limit = f"LIMIT {int(app.config['ANALYTICS_TOP_EMPLOYEES'])}" if group == 'employee' else ""
+
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
+        cur = conn.cursor(dictionary=True)
+        cur.execute(f"""
+            SELECT {key} AS `key`, SUM(movements) AS movements, SUM(total_seconds) AS total_seconds, MAX(max_seconds) AS max_seconds 
+            FROM movement_rollup 
+            WHERE {' AND '.join(clauses)} 
+            GROUP BY {key} 
+            ORDER BY {order} 
+            {limit}
+        """, params)
+        rows = cur.fetchall()
+        cur.close()
+
+    result = []
+    for row in rows:
+        movements = int(row['movements'] or 0)
+        total = int(row['total_seconds'] or 0)
+        result.append({
+            group: row['key'].strftime('%Y-%m-%d') if group == 'day' else row['key'],
+            'movements': movements,
+            'total_seconds': total,
+            'avg_seconds': round(total / movements) if movements else None,
+            'max_seconds': int(row['max_seconds'] or 0)
+        })
+
+    return jsonify({
+        'from': start_day.strftime('%Y-%m-%d'),
+        'to': end_day.strftime('%Y-%m-%d'),
+        'group': group,
+        'rows': result
+    })
+
+@app.route('/analytics/rebuild', methods=['POST'])
+def analytics_rebuild():
+    # Backfills the rollup for older history (e.g. right after migrating), a
+    # month per transaction so no single statement locks the whole range
+    if not session.get('hr_logged_in'):
+        return jsonify({'error': 'HR login required'}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        start_day = datetime.strptime(data['from'], '%Y-%m-%d').date()
+        end_day = datetime.strptime(data['to'], '%Y-%m-%d').date() + timedelta(days=1) if data.get('to') else datetime.now().date() + timedelta(days=1)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Invalid filter'}), 400
+
+    rows = 0
+    chunk_start = start_day
+    with db_conn() as conn:
+        if not conn:
+            return jsonify({'error': 'DB connection failed'}), 500
+        while chunk_start < end_day:
+            chunk_end = min(end_day, (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1))
+            try:
+                rows += rebuild_rollup(conn, chunk_start, chunk_end)
+            except RollupBusy as e:
+                logging.error(f"Analytics rollup rebuild stopped at {chunk_start}: {e}")
+                return jsonify({'error': 'Rollup is busy, please retry', 'rebuilt_until': chunk_start.strftime('%Y-%m-%d')}), 503
+            chunk_start = chunk_end
+
+    logging.info(f"Analytics rollup rebuilt from {start_day} to {end_day}: {rows} employee-days")
+    return jsonify({'success': True, 'employee_days': rows})
+
+EXPORT_COLUMNS = ['ID', 'Employee_no', 'Employee_name', 'Department', 'Location', 'Purpose', 'checkout_time', 'checkin_time', 'status']
+EXPORT_STATUSES = ('PENDING', 'OUT', 'IN')
+
+def generate_csv(cur, chunk_rows, compress, release):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    row_count = 0
+    discard = True
+
+    def flush():
+        data = output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate(0)
+        return compressor.compress(data) if compressor else data
+
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.writerows(rows)
+            row_count += len(rows)
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+        tail = flush()
+        if compressor:
+            tail += compressor.flush()
+        if tail:
+            yield tail
+        discard = False
+        logging.info(f"CSV export completed: {row_count} rows")
+    finally:
+        # An export abandoned mid-stream leaves unread rows on the connection
+        release(discard)
 
 @app.route('/export', methods=['GET'])
 def export_csv():
-    conn = get_conn()
+    try:
+        clauses, params = build_history_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter'}), 400
+
+    status = request.args.get('status')
+    if status:
+        statuses = [s.strip().upper() for s in status.split(',') if s.strip()]
+        if not statuses or any(s not in EXPORT_STATUSES for s in statuses):
+            return jsonify({'error': 'Invalid status'}), 400
+        clauses.append(f"status IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    columns = ', '.join(EXPORT_COLUMNS)
+    if reaches_archive(request.args):
+        source = f"SELECT {columns} FROM checkout {where} UNION ALL SELECT {columns} FROM checkout_archive {where}"
+        params = params * 2
+    else:
+        source = f"SELECT {columns} FROM checkout {where}"
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    conn = db_pool.acquire()
     if not conn:
         return jsonify({'error': 'DB connection failed'}), 500
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status 
-        FROM checkout 
-        ORDER BY checkout_time DESC
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Employee_no', 'Employee_name', 'Department', 'Location', 'Purpose', 'checkout_time', 'checkin_time', 'status'])
-    for r in rows:
-        writer.writerow([
-            r['ID'], r['Employee_no'], r['Employee_name'], r['Department'], r['Location'], r['Purpose'], r['checkout_time'], r['checkin_time'], r['status']
-        ])
-    output.seek(0)
-    return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={"Content-Disposition": "attachment;filename=checkout_history.csv"}
+    # Unbuffered cursor: rows are pulled from the server as the response is written
+    try:
+        cur = conn.cursor(buffered=False)
+        cur.execute(f"""
+            {source}
+            ORDER BY checkout_time DESC
+        """, params)
+    except Exception:
+        db_pool.release(conn, discard=True)
+        raise
+
+    def release(discard=True):
+        # Runs when the stream ends, or from the response's close when the body
+        # is never iterated (HEAD requests, clients gone before the first chunk)
+        nonlocal conn
+        if conn is None:
+            return
+        try:
+            cur.close()
+        except Error:
+            pass
+        db_pool.release(conn, discard=discard)
+        conn = None
+
+    filename = 'checkout_history.csv.gz' if compress else 'checkout_history.csv'
+    response = Response(
+        stream_with_context(generate_csv(cur, app.config['EXPORT_CHUNK_ROWS'], compress, release)),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
     )
+    response.call_on_close(release)
+    return response
 
 @app.route('/hr-logout')
 def hr_logout():
     session.clear()
     return redirect(url_for('dashboard_page'))
 
+_services_lock = threading.Lock()
+_services_pid = None
+
+def create_app(config=None):
+    # Applies configuration and builds the objects sized from it. No threads,
+    # sockets or files are opened here, so the module (which calls this on
+    # import) is safe to load in gunicorn's master with preload_app; background
+    # work begins in start_services(). Without SECRET_KEY a random key is
+    # generated here, so preloaded workers at least share it.
+    global event_broker, employee_cache, session_index, guardhouse_journal, notifier, profiler
+    if _services_pid == os.getpid():
+        raise RuntimeError("create_app() must be called before start_services()")
+
+    # FLASK_SECRET_KEY, FLASK_MYSQL_HOST, FLASK_SCHEDULER_MODE, ...; values the
+    # caller passes explicitly win over the environment
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    if not app.config['SECRET_KEY']:
+        logging.warning("SECRET_KEY is not set; sessions will not survive a restart or be shared between workers")
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+
+    event_broker = EventBroker(
+        history_size=app.config['EVENTS_HISTORY_SIZE'],
+        queue_size=app.config['EVENTS_SUBSCRIBER_QUEUE_SIZE']
+    )
+    employee_cache = TTLCache(
+        maxsize=app.config['EMPLOYEE_CACHE_SIZE'],
+        ttl=app.config['EMPLOYEE_CACHE_TTL'],
+        negative_ttl=app.config['EMPLOYEE_CACHE_NEGATIVE_TTL']
+    )
+    session_index = SessionIndex(
+        ttl=app.config['SESSION_INDEX_TTL'],
+        stale_ttl=app.config['GUARDHOUSE_SESSION_TTL'] if app.config['GUARDHOUSE_MODE'] != 'off' else None
+    )
+    guardhouse_journal = GuardhouseJournal(
+        app.config['GUARDHOUSE_JOURNAL'],
+        sync_interval=app.config['GUARDHOUSE_SYNC_INTERVAL'],
+        keep_synced_hours=app.config['GUARDHOUSE_KEEP_SYNCED_HOURS']
+    )
+    notifier = SMTPNotifier(
+        workers=NOTIFY_WORKERS,
+        queue_size=NOTIFY_QUEUE_SIZE,
+        max_retries=NOTIFY_MAX_RETRIES,
+        backoff=NOTIFY_RETRY_BACKOFF,
+        idle_timeout=SMTP_IDLE_TIMEOUT
+    )
+    profiler = SamplingProfiler(app.config['PROFILER_INTERVAL'], app.config['PROFILER_OUTPUT_DIR'])
+
+    # The pool and leader hold module-level atexit hooks, so they are updated in place
+    db_pool.size = app.config['MYSQL_POOL_SIZE']
+    db_pool.max_overflow = app.config['MYSQL_POOL_MAX_OVERFLOW']
+    db_pool.recycle = app.config['MYSQL_POOL_RECYCLE']
+    db_pool.pre_ping = app.config['MYSQL_POOL_PRE_PING']
+    db_pool.timeout = app.config['MYSQL_POOL_TIMEOUT']
+    scheduler_leader.backend = app.config['SCHEDULER_LOCK_BACKEND']
+    scheduler_leader.lock_name = app.config['SCHEDULER_LOCK_NAME']
+    scheduler_leader.lock_file = app.config['SCHEDULER_LOCK_FILE']
+    scheduler_leader.retry = app.config['SCHEDULER_LEADER_RETRY']
+    return app
+
+def warm_caches():
+    # Run once in the preloading master: compiled templates and static asset
+    # hashes are then shared copy-on-write instead of rebuilt by every worker
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    for root, _, files in os.walk(app.static_folder):
+        for name in files:
+            static_fingerprint(os.path.relpath(os.path.join(root, name), app.static_folder))
+
+def start_services():
+    # Starts this process's background threads; called from gunicorn's
+    # post_worker_init hook, and on the first request as a fallback
+    global _services_pid
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+
+    if app.config['SLOW_REQUEST_LOG'] and not slow_request_log.handlers:
+        slow_request_log.addHandler(logging.FileHandler(app.config['SLOW_REQUEST_LOG']))
+    start_scheduler()
+    if app.config['EVENTS_BACKEND'] != 'local':
+        # Keeps the session index in step even in workers that only take writes
+        start_event_relay()
+    if app.config['GUARDHOUSE_MODE'] != 'off':
+        # Replays whatever an earlier run of this node left in the journal
+        guardhouse_journal.start()
+    if app.config['PROFILING_ENABLED'] and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, toggle_profiler)
+    logging.info(f"Background services started in pid {os.getpid()} (scheduler mode {app.config['SCHEDULER_MODE']})")
+
+def stop_services():
+    # Called from gunicorn's worker_exit hook; sends buffered digests and lets
+    # the notifier drain before a recycled worker goes away
+    digest.flush_all()
+    if notifier:
+        notifier.shutdown()
+
+create_app()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=, debug=True)
+    # The reloader imports this module twice; only its child serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
+    app.run(host='0.0.0.0', port=5000, debug=True)
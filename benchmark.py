@@ -0,0 +1,380 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import subprocess
+import http.client
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, urlencode
+from datetime import datetime, timedelta
+
+import migrate
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+DEPARTMENTS = ['HI', 'HR', 'IT', 'FIN', 'OPS', 'ENG', 'QA', 'LOG', 'PRD', 'MNT']
+LOCATIONS = ['Client site', 'Head office', 'Warehouse', 'Bank', 'Supplier visit', 'Training centre']
+PURPOSES = ['Meeting', 'Delivery', 'Site inspection', 'Training', 'Errand', 'Audit']
+
+BENCH_PREFIX = 'B'
+BENCH_HR_USER = 'bench-hr'
+BENCH_HR_PASSWORD = 'bench-hr'
+
+def employee_no(i):
+    return f"{BENCH_PREFIX}{i:07d}"
+
+def seed(conn, employees, history, days, batch_size, rng, reset=False):
+    # Reproducible for a given --seed: same employees, same movement history
+    cur = conn.cursor()
+
+    if reset:
+        logging.info("Removing previous benchmark data")
+        cur.execute("DELETE FROM checkout WHERE Employee_no LIKE %s", (f"{BENCH_PREFIX}%",))
+        cur.execute("DELETE FROM employee WHERE Employee_no LIKE %s", (f"{BENCH_PREFIX}%",))
+        conn.commit()
+
+    rows = [
+        (employee_no(i), f"Bench Employee {i}", DEPARTMENTS[i % len(DEPARTMENTS)])
+        for i in range(employees)
+    ]
+    for start in range(0, len(rows), batch_size):
+        cur.executemany(
+            "INSERT IGNORE INTO employee (Employee_no, Employee_name, Department) VALUES (%s, %s, %s)",
+            rows[start:start + batch_size]
+        )
+        conn.commit()
+    cur.execute("SELECT COUNT(*) FROM auth_user WHERE username=%s", (BENCH_HR_USER,))
+    if not cur.fetchone()[0]:
+        cur.execute(
+            "INSERT INTO auth_user (username, password, department) VALUES (%s, %s, 'HR')",
+            (BENCH_HR_USER, BENCH_HR_PASSWORD)
+        )
+        conn.commit()
+    logging.info(f"Seeded {employees} employees")
+
+    # Completed movements spread over the last `days` days, most of them in
+    # working hours the way real shift changes cluster
+    now = datetime.now().replace(microsecond=0)
+    started = time.monotonic()
+    inserted = 0
+    while inserted < history:
+        batch = []
+        for _ in range(min(batch_size, history - inserted)):
+            i = rng.randrange(employees)
+            day = now - timedelta(days=rng.randrange(1, days + 1))
+            checkout_time = day.replace(hour=rng.choice((7, 8, 9, 12, 13, 17, 18)), minute=rng.randrange(60), second=rng.randrange(60))
+            checkin_time = checkout_time + timedelta(minutes=rng.randrange(5, 480))
+            batch.append((
+                employee_no(i), f"Bench Employee {i}", DEPARTMENTS[i % len(DEPARTMENTS)],
+                rng.choice(LOCATIONS), rng.choice(PURPOSES),
+                checkout_time, checkin_time, checkin_time, checkin_time
+            ))
+        cur.executemany("""
+            INSERT INTO checkout (Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 'IN', %s, %s)
+        """, batch)
+        conn.commit()
+        inserted += len(batch)
+        if inserted % (batch_size * 100) == 0 or inserted == history:
+            rate = inserted / max(time.monotonic() - started, 0.001)
+            logging.info(f"Seeded {inserted}/{history} movements ({rate:.0f} rows/s)")
+
+    cur.close()
+
+class Client:
+    # One keep-alive HTTP connection with just enough cookie handling for the
+    # checkout_session token and the HR session
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.timeout = timeout
+        self.cookies = {}
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._conn = cls(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Server closed the keep-alive connection; retry once on a new one
+                conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+        for header in resp.headers.get_all('Set-Cookie') or []:
+            cookie = SimpleCookie(header)
+            for name, morsel in cookie.items():
+                if morsel['max-age'] == '0' or morsel['expires'].startswith('Thu, 01 Jan 1970'):
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return resp.status, resp.headers, data
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = {}
+
+    def timed(self, name, client, method, path, body=None, headers=None, ok=(200,)):
+        started = time.perf_counter()
+        try:
+            status, resp_headers, data = client.request(method, path, body, headers)
+        except (http.client.HTTPException, OSError) as e:
+            status, resp_headers, data = None, {}, b''
+            logging.debug(f"{name}: {e}")
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            self.bytes[name] = self.bytes.get(name, 0) + len(data)
+            if status not in ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        return status, resp_headers, data
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def movement_worker(args, recorder, stop, worker_id):
+    # Each worker owns every `concurrency`-th employee, so no two workers ever
+    # pre-register the same person at the same time
+    rng = random.Random(args.seed * 1000 + worker_id)
+    owned = range(worker_id, args.employees, args.concurrency)
+    while not stop.is_set():
+        no = employee_no(rng.choice(owned))
+        client = Client(args.url)
+        try:
+            status, _, _ = recorder.timed('/checkout', client, 'POST', '/checkout', {
+                'Employee_no': no,
+                'Department': DEPARTMENTS[int(no[1:]) % len(DEPARTMENTS)],
+                'Location': rng.choice(LOCATIONS),
+                'Purpose': rng.choice(PURPOSES),
+            })
+            if status != 200:
+                continue
+            recorder.timed('/scan-confirm', client, 'GET', '/scan-confirm')
+            status, _, _ = recorder.timed('/confirm-checkout', client, 'POST', '/confirm-checkout')
+            if status != 200:
+                continue
+            if args.think_time:
+                time.sleep(rng.uniform(0, args.think_time))
+            recorder.timed('/checkin/<employee_no>', client, 'PUT', f"/checkin/{no}", ok=(200, 403))
+        finally:
+            client.close()
+
+def dashboard_worker(args, recorder, stop, worker_id):
+    # Mirrors dashboard.html: one full load, then delta polls with the change cursor
+    client = Client(args.url)
+    change_cursor = None
+    etag = None
+    while not stop.is_set():
+        if change_cursor:
+            headers = {'If-None-Match': etag} if etag else {}
+            status, resp_headers, _ = recorder.timed(
+                '/checkout-history (delta)', client, 'GET',
+                f"/checkout-history?{urlencode({'since': change_cursor})}", headers=headers, ok=(200, 304)
+            )
+        else:
+            status, resp_headers, _ = recorder.timed('/checkout-history', client, 'GET', '/checkout-history')
+        if status in (200, 304):
+            change_cursor = resp_headers.get('X-Change-Cursor') or change_cursor
+            etag = resp_headers.get('ETag') or etag
+        stop.wait(args.poll_interval)
+    client.close()
+
+def export_worker(args, recorder, stop, worker_id):
+    client = Client(args.url, timeout=600)
+    recorder.timed('/hr-login', client, 'POST', '/hr-login', {
+        'username': BENCH_HR_USER, 'password': BENCH_HR_PASSWORD
+    })
+    start = (datetime.now() - timedelta(days=args.export_days)).strftime('%Y-%m-%d')
+    while not stop.is_set():
+        recorder.timed('/checkout-history (HR page)', client, 'GET', f"/checkout-history?{urlencode({'from': start})}")
+        recorder.timed('/export', client, 'GET', f"/export?{urlencode({'from': start, 'gzip': 1})}")
+        stop.wait(args.export_interval)
+    client.close()
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=migrate.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = []
+    for target, count in (
+        (movement_worker, args.concurrency),
+        (dashboard_worker, args.dashboard_clients),
+        (export_worker, args.export_clients),
+    ):
+        for i in range(count):
+            threads.append(threading.Thread(target=target, args=(args, recorder, stop, i), daemon=True))
+
+    logging.info(f"Running {args.concurrency} movement, {args.dashboard_clients} dashboard and {args.export_clients} export clients against {args.url} for {args.duration}s")
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        logging.info("Interrupted, collecting results")
+    stop.set()
+    elapsed = time.monotonic() - started
+    for t in threads:
+        t.join(30)
+
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        values.sort()
+        endpoints[name] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(name, 0),
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+            'bytes': recorder.bytes.get(name, 0),
+        }
+
+    return {
+        'revision': git_revision(),
+        'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'url': args.url,
+        'duration': round(elapsed, 2),
+        'concurrency': args.concurrency,
+        'dashboard_clients': args.dashboard_clients,
+        'export_clients': args.export_clients,
+        'seed': args.seed,
+        'endpoints': endpoints,
+    }
+
+def print_report(result):
+    print(f"\nrevision {result['revision']}  duration {result['duration']}s  concurrency {result['concurrency']}")
+    print(f"{'endpoint':<30} {'reqs':>8} {'err':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, e in result['endpoints'].items():
+        print(f"{name:<30} {e['requests']:>8} {e['errors']:>6} {e['throughput']:>9} {e['p50_ms']:>9} {e['p95_ms']:>9} {e['p99_ms']:>9} {e['max_ms']:>9}")
+
+def compare(baseline, current, threshold):
+    # Flags endpoints whose p95 grew or throughput fell by more than threshold percent
+    regressions = 0
+    print(f"{'endpoint':<30} {'p95 base':>9} {'p95 now':>9} {'change':>8} {'req/s base':>11} {'req/s now':>10} {'change':>8}")
+    for name, now in current['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if not base:
+            continue
+        p95_change = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0
+        rps_change = (now['throughput'] - base['throughput']) / base['throughput'] * 100 if base['throughput'] else 0
+        flag = ''
+        if p95_change > threshold or -rps_change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:<30} {base['p95_ms']:>9} {now['p95_ms']:>9} {p95_change:>7.1f}% {base['throughput']:>11} {now['throughput']:>10} {rps_change:>7.1f}%{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed benchmark data and replay shift-change load against the movement tracking app.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = sub.add_parser('seed', help='create the schema and load benchmark employees and history')
+    seed_parser.add_argument('--host', default=os.environ.get('MYSQL_HOST', 'localhost'))
+    seed_parser.add_argument('--port', type=int, default=int(os.environ.get('MYSQL_PORT', 3306)))
+    seed_parser.add_argument('--user', default=os.environ.get('MYSQL_USER', ''))
+    seed_parser.add_argument('--password', default=os.environ.get('MYSQL_PASSWORD', ''))
+    seed_parser.add_argument('--database', default=os.environ.get('MYSQL_DB', ''))
+    seed_parser.add_argument('--employees', type=int, default=10000)
+    seed_parser.add_argument('--history', type=int, default=5000000, help='completed movements to insert')
+    seed_parser.add_argument('--days', type=int, default=365, help='spread history over this many days')
+    seed_parser.add_argument('--batch-size', type=int, default=5000)
+    seed_parser.add_argument('--seed', type=int, default=42)
+    seed_parser.add_argument('--reset', action='store_true', help='delete earlier benchmark rows first')
+
+    run_parser = sub.add_parser('run', help='replay pre-register -> confirm -> check-in with dashboard polling and exports')
+    run_parser.add_argument('--url', default='http://localhost:5000')
+    run_parser.add_argument('--duration', type=int, default=60, help='seconds')
+    run_parser.add_argument('--concurrency', type=int, default=50, help='concurrent employee movement flows')
+    run_parser.add_argument('--employees', type=int, default=10000, help='must match the seeded employee count')
+    run_parser.add_argument('--think-time', type=float, default=0, help='max seconds between confirm and check-in')
+    run_parser.add_argument('--dashboard-clients', type=int, default=5)
+    run_parser.add_argument('--poll-interval', type=float, default=2)
+    run_parser.add_argument('--export-clients', type=int, default=1)
+    run_parser.add_argument('--export-interval', type=float, default=10)
+    run_parser.add_argument('--export-days', type=int, default=30, help='date range of each export')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--output', help='write the results as JSON for later comparison')
+
+    compare_parser = sub.add_parser('compare', help='compare two result files from run --output')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='percent change treated as a regression')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'seed':
+        try:
+            conn = migrate.connect(args)
+        except migrate.Error as e:
+            logging.error(f"MySQL connection error: {e}")
+            return 2
+        try:
+            migrate.migrate(conn)
+            seed(conn, args.employees, args.history, args.days, args.batch_size, random.Random(args.seed), reset=args.reset)
+        finally:
+            conn.close()
+        return 0
+
+    if args.command == 'run':
+        if args.concurrency > args.employees:
+            parser.error('--concurrency cannot exceed --employees')
+        result = run(args)
+        print_report(result)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            logging.info(f"Results written to {args.output}")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    return 1 if compare(baseline, current, args.threshold) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
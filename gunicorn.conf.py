@@ -0,0 +1,57 @@
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# WORKER_CLASS=sync (default) gives one request per worker process. With
+# WORKER_CLASS=gevent every worker serves up to WORKER_CONNECTIONS requests
+# concurrently: MySQL queries, SMTP sends, pool waits and /events streams all
+# yield to other requests instead of blocking the process, so a single worker
+# can hold thousands of idle scan requests and SSE clients. /events only
+# streams under gevent (EVENTS_STREAMING); with sync workers each open tab
+# would pin a worker, so the pages poll for deltas instead.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+worker_class = os.environ.get('WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 2000))
+
+# Sync workers are killed after `timeout` seconds in one request, so the
+# default leaves room for a streamed /export of a large date range; a worker
+# that really hangs is also only replaced after that long. gevent workers
+# heartbeat while requests run, so their timeout only has to cover a blocked loop
+timeout = int(os.environ.get('TIMEOUT', 600 if worker_class == 'sync' else 120))
+graceful_timeout = 30
+keepalive = 5
+
+# With preload the master imports the app once and workers fork from it, so
+# they boot without re-importing and share its memory copy-on-write. gevent
+# has to patch the standard library before the app is imported, which only
+# happens inside the worker, so preload stays off for it.
+preload_app = os.environ.get('PRELOAD', '1' if worker_class == 'sync' else '0') == '1'
+
+accesslog = '-'
+
+
+def when_ready(server):
+    # Master, before the first fork
+    if server.cfg.preload_app:
+        import gc
+        from app import warm_caches
+        warm_caches()
+        # Keeps the collector from touching (and so copying) the preloaded objects
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Importing app.py starts no threads; each worker starts its own here
+    from app import start_services
+    start_services()
+
+
+def worker_exit(server, worker):
+    # Also covers workers recycled by max_requests or a graceful reload. The
+    # master calls this hook too when it reaps a worker; only the worker flushes
+    if worker.pid != os.getpid():
+        return
+    from app import stop_services
+    stop_services()
+
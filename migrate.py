@@ -0,0 +1,368 @@
+import os
+import re
+import ast
+import sys
+import glob
+import logging
+import argparse
+import mysql.connector
+from datetime import datetime
+from mysql.connector import Error, errorcode
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+APP_SOURCE = os.path.join(BASE_DIR, 'app.py')
+
+# Tables as app.py has always used them; later changes live in migrations/*.sql
+BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS employee (
+        Employee_no VARCHAR(20) NOT NULL,
+        Employee_name VARCHAR(100) NOT NULL,
+        Department VARCHAR(50) NOT NULL,
+        PRIMARY KEY (Employee_no)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS auth_user (
+        id INT UNSIGNED NOT NULL AUTO_INCREMENT,
+        username VARCHAR(100) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        department VARCHAR(50) NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS checkout (
+        ID INT UNSIGNED NOT NULL AUTO_INCREMENT,
+        Employee_no VARCHAR(20) NOT NULL,
+        Employee_name VARCHAR(100) NOT NULL,
+        Department VARCHAR(50) NOT NULL,
+        Location VARCHAR(255) NOT NULL,
+        Purpose VARCHAR(255) NOT NULL,
+        checkout_time DATETIME NULL,
+        checkin_time DATETIME NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'PENDING',
+        session_token VARCHAR(64) NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (version)
+    )
+    """,
+]
+
+# Errors meaning a migration's change is already in place (applied by hand before
+# schema_migrations existed)
+ALREADY_APPLIED = {
+    errorcode.ER_DUP_FIELDNAME,
+    errorcode.ER_DUP_KEYNAME,
+    errorcode.ER_TABLE_EXISTS_ERROR,
+    errorcode.ER_MULTIPLE_PRI_KEY,
+}
+
+# app.py builds these at request time, so they cannot be read from the source.
+# Each entry is a representative shape of a dynamic query with sample params.
+DYNAMIC_STATEMENTS = [
+    (
+        "checkout_history (HR, first page)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+        FROM checkout
+        WHERE status IN ('OUT', 'IN')
+        ORDER BY checkout_time DESC, ID DESC
+        LIMIT %s
+        """,
+        (101,)
+    ),
+    (
+        "checkout_history (HR, month filter + cursor)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+        FROM checkout
+        WHERE status IN ('OUT', 'IN') AND checkout_time >= %s AND checkout_time < %s
+        AND (checkout_time < %s OR (checkout_time = %s AND ID < %s))
+        ORDER BY checkout_time DESC, ID DESC
+        LIMIT %s
+        """,
+        (datetime(2024, 1, 1), datetime(2024, 2, 1), datetime(2024, 1, 15), datetime(2024, 1, 15), 1000, 101)
+    ),
+    (
+        "checkout_history (delta since cursor)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+        FROM checkout
+        WHERE status IN ('OUT', 'IN') AND updated_at > %s
+        ORDER BY updated_at
+        LIMIT %s
+        """,
+        (datetime.now(), 501)
+    ),
+    (
+        "export_csv (date range)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+        FROM checkout
+        WHERE checkout_time >= %s AND checkout_time < %s
+        ORDER BY checkout_time DESC
+        """,
+        (datetime(2024, 1, 1), datetime(2024, 2, 1))
+    ),
+    (
+        "checkout_history (archive page)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time, checkin_time, status
+        FROM checkout_archive
+        WHERE status IN ('OUT', 'IN') AND Department=%s
+        AND (checkout_time < %s OR (checkout_time = %s AND ID < %s))
+        ORDER BY checkout_time DESC, ID DESC
+        LIMIT %s
+        """,
+        ('IT', datetime(2024, 1, 15), datetime(2024, 1, 15), 1000, 101)
+    ),
+    (
+        "group_checkout (active check)",
+        """
+        SELECT Employee_no FROM checkout WHERE Employee_no IN (%s, %s, %s) AND status IN ('PENDING', 'OUT')
+        """,
+        ('E001', 'E002', 'E003')
+    ),
+    (
+        "group_checkin (active rows)",
+        """
+        SELECT ID, Employee_no, Employee_name, Department, Location, Purpose, checkout_time
+        FROM checkout WHERE Employee_no IN (%s, %s, %s) AND status='OUT'
+        """,
+        ('E001', 'E002', 'E003')
+    ),
+    (
+        "analytics (department totals)",
+        """
+        SELECT Department AS `key`, SUM(movements), SUM(total_seconds), MAX(max_seconds)
+        FROM movement_rollup
+        WHERE day >= %s AND day < %s AND Department <> '*' AND Employee_no = '*'
+        GROUP BY Department
+        """,
+        (datetime(2024, 1, 1).date(), datetime(2024, 2, 1).date())
+    ),
+    (
+        "analytics (one employee by day)",
+        """
+        SELECT day AS `key`, SUM(movements), SUM(total_seconds), MAX(max_seconds)
+        FROM movement_rollup
+        WHERE day >= %s AND day < %s AND Employee_no=%s
+        GROUP BY day
+        """,
+        (datetime(2024, 1, 1).date(), datetime(2024, 2, 1).date(), 'E001')
+    ),
+    (
+        "archive_completed_movements (batch select)",
+        """
+        SELECT ID FROM checkout WHERE status = 'IN' AND checkout_time < %s AND id > %s ORDER BY id LIMIT %s
+        """,
+        (datetime.now(), 0, 1000)
+    ),
+    (
+        "daily_maintenance (batch select)",
+        """
+        SELECT ID FROM checkout WHERE status='OUT' AND checkout_time < CURDATE() AND id > %s ORDER BY id LIMIT %s
+        """,
+        (0, 1000)
+    ),
+    (
+        "cleanup_session_tokens (batch select)",
+        """
+        SELECT ID FROM checkout WHERE session_token IS NOT NULL AND status = 'IN' AND checkin_time < NOW() - INTERVAL 15 MINUTE AND id > %s ORDER BY id LIMIT %s
+        """,
+        (0, 1000)
+    ),
+    (
+        "cleanup_pending_checkouts (batch select)",
+        """
+        SELECT ID FROM checkout WHERE status = 'PENDING' AND created_at < NOW() - INTERVAL 20 MINUTE AND id > %s ORDER BY id LIMIT %s
+        """,
+        (0, 1000)
+    ),
+    (
+        "cleanup_movement_events (batch select)",
+        """
+        SELECT id FROM movement_event WHERE created_at < NOW() - INTERVAL %s MINUTE AND id > %s ORDER BY id LIMIT %s
+        """,
+        (60, 0, 1000)
+    ),
+]
+
+def connect(args):
+    return mysql.connector.connect(
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        charset='utf8mb4',
+        use_unicode=True
+    )
+
+def split_statements(sql):
+    # Migration files are plain DDL; strip comments and split on ';'
+    sql = re.sub(r'--[^\n]*', '', sql)
+    return [stmt.strip() for stmt in sql.split(';') if stmt.strip()]
+
+def migration_files():
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')))
+
+def migrate(conn, dry_run=False):
+    cur = conn.cursor()
+
+    for stmt in BASE_SCHEMA:
+        if not dry_run:
+            cur.execute(stmt)
+
+    applied = set()
+    try:
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+    except Error:
+        # Only possible on a dry run against a database that was never migrated
+        if not dry_run:
+            raise
+
+    pending = [path for path in migration_files() if os.path.basename(path) not in applied]
+    if not pending:
+        logging.info("Schema is up to date")
+
+    for path in pending:
+        version = os.path.basename(path)
+        with open(path, encoding='utf-8') as f:
+            statements = split_statements(f.read())
+
+        logging.info(f"Applying {version} ({len(statements)} statements)")
+        if dry_run:
+            for stmt in statements:
+                print(stmt + ';\n')
+            continue
+
+        for stmt in statements:
+            try:
+                cur.execute(stmt)
+            except Error as e:
+                if e.errno in ALREADY_APPLIED:
+                    logging.warning(f"{version}: already in place ({e.msg})")
+                    continue
+                raise
+
+        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+
+    cur.close()
+
+def extract_statements(source_path=APP_SOURCE):
+    # Finds every cur.execute("<literal SQL>", ...) in app.py. Only MySQL cursors
+    # are named cur; the guardhouse journal's SQLite calls are left out.
+    with open(source_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=source_path)
+
+    statements = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr not in ('execute', 'executemany') or not node.args:
+            continue
+        if not (isinstance(node.func.value, ast.Name) and node.func.value.id == 'cur'):
+            continue
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            statements.append((node.lineno, arg.value))
+    return [(f"app.py:{lineno}", sql) for lineno, sql in sorted(statements)]
+
+def sample_params(sql):
+    # Plausible values for each %s so EXPLAIN sees the same column types as the app
+    params = []
+    for match in re.finditer(r'%s', sql):
+        before = sql[:match.start()]
+        comparison = re.search(r'(\w+)\s*(?:=|<|>|<=|>=|<>|LIKE)\s*$', before, re.IGNORECASE)
+        if re.search(r'\b(LIMIT|INTERVAL)\s*$', before, re.IGNORECASE):
+            params.append(10)
+        elif comparison and comparison.group(1).lower().endswith(('_time', '_at')):
+            params.append(datetime.now())
+        elif comparison and comparison.group(1).lower() == 'id':
+            params.append(1)
+        else:
+            params.append('0')
+    return tuple(params)
+
+def explain(conn, label, sql, params):
+    stmt = ' '.join(sql.split())
+    if not re.match(r'(SELECT|UPDATE|DELETE)\b', stmt, re.IGNORECASE):
+        return None
+
+    cur = conn.cursor(dictionary=True)
+    cur.execute(f"EXPLAIN {stmt}", params)
+    plan = cur.fetchall()
+    cur.close()
+
+    problems = []
+    for row in plan:
+        if row.get('type') == 'ALL':
+            problems.append(f"full table scan on {row.get('table')} (rows={row.get('rows')}, possible_keys={row.get('possible_keys')})")
+        elif row.get('type') == 'index' and row.get('Extra') and 'Using where' in row['Extra']:
+            logging.warning(f"{label}: full index scan on {row.get('table')} via {row.get('key')}")
+    return problems
+
+def check(conn):
+    statements = [(label, sql, sample_params(sql)) for label, sql in extract_statements()]
+    statements.extend(DYNAMIC_STATEMENTS)
+
+    failures = 0
+    checked = 0
+    for label, sql, params in statements:
+        try:
+            problems = explain(conn, label, sql, params)
+        except Error as e:
+            logging.error(f"{label}: EXPLAIN failed: {e.msg}")
+            failures += 1
+            continue
+        if problems is None:
+            continue
+        checked += 1
+        for problem in problems:
+            logging.error(f"{label}: {problem}\n    {' '.join(sql.split())}")
+            failures += 1
+
+    logging.info(f"Checked {checked} statements, {failures} problems")
+    return failures == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create/upgrade the movement tracking schema and check query plans.')
+    parser.add_argument('--host', default=os.environ.get('MYSQL_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MYSQL_PORT', 3306)))
+    parser.add_argument('--user', default=os.environ.get('MYSQL_USER', ''))
+    parser.add_argument('--password', default=os.environ.get('MYSQL_PASSWORD', ''))
+    parser.add_argument('--database', default=os.environ.get('MYSQL_DB', ''))
+    parser.add_argument('--dry-run', action='store_true', help='print pending migrations without applying them')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN every query in app.py and fail on full table scans')
+    args = parser.parse_args(argv)
+
+    try:
+        conn = connect(args)
+    except Error as e:
+        logging.error(f"MySQL connection error: {e}")
+        return 2
+
+    try:
+        if args.check:
+            return 0 if check(conn) else 1
+        migrate(conn, dry_run=args.dry_run)
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
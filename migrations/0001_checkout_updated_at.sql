@@ -0,0 +1,5 @@
+-- Change cursor for /checkout-history delta polling.
+-- The application also sets updated_at explicitly on every write.
+ALTER TABLE checkout
+    ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    ADD INDEX idx_checkout_updated_at (updated_at);
@@ -0,0 +1,10 @@
+-- Event log behind the /events live feed. Every web worker tails this table
+-- and the id doubles as the SSE event id for Last-Event-ID reconnects.
+CREATE TABLE IF NOT EXISTS movement_event (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+    event VARCHAR(32) NOT NULL,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (id),
+    INDEX idx_movement_event_created_at (created_at)
+);
@@ -0,0 +1,22 @@
+-- Indexes for the hot checkout queries in app.py (verify with: python migrate.py --check)
+
+-- /session-status, /scan-confirm, /confirm-checkout
+ALTER TABLE checkout ADD INDEX idx_checkout_session_token (session_token, status);
+
+-- /checkout active-session check, /checkin/<no>, /checkout-status/<no>
+ALTER TABLE checkout ADD INDEX idx_checkout_employee_status (Employee_no, status);
+
+-- cleanup_pending_checkouts()
+ALTER TABLE checkout ADD INDEX idx_checkout_status_created (status, created_at);
+
+-- cleanup_session_tokens()
+ALTER TABLE checkout ADD INDEX idx_checkout_status_checkin (status, checkin_time);
+
+-- dashboard (status='OUT' ORDER BY checkout_time) and daily_maintenance()
+ALTER TABLE checkout ADD INDEX idx_checkout_status_checkout_time (status, checkout_time);
+
+-- HR history keyset pages and /export (ORDER BY checkout_time DESC, ID DESC)
+ALTER TABLE checkout ADD INDEX idx_checkout_checkout_time (checkout_time);
+
+-- /hr-login
+ALTER TABLE auth_user ADD INDEX idx_auth_user_username (username);
@@ -0,0 +1,7 @@
+-- At most one PENDING/OUT movement per employee, enforced by the database.
+-- active_employee_no is NULL for completed rows, and NULLs never collide in a
+-- unique index. Resolve any existing duplicate active rows before applying.
+ALTER TABLE checkout
+    ADD COLUMN active_employee_no VARCHAR(20)
+        GENERATED ALWAYS AS (CASE WHEN status IN ('PENDING', 'OUT') THEN Employee_no END) VIRTUAL,
+    ADD UNIQUE INDEX uq_checkout_active_employee (active_employee_no);
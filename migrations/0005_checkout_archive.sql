@@ -0,0 +1,19 @@
+-- Cold storage for completed movements. archive_completed_movements() moves
+-- IN rows older than ARCHIVE_AFTER_DAYS here so the live checkout table stays
+-- small; HR history and /export read both tables for older date ranges.
+CREATE TABLE IF NOT EXISTS checkout_archive (
+    ID INT UNSIGNED NOT NULL,
+    Employee_no VARCHAR(20) NOT NULL,
+    Employee_name VARCHAR(100) NOT NULL,
+    Department VARCHAR(50) NOT NULL,
+    Location VARCHAR(255) NOT NULL,
+    Purpose VARCHAR(255) NOT NULL,
+    checkout_time DATETIME NULL,
+    checkin_time DATETIME NULL,
+    status VARCHAR(10) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ID),
+    INDEX idx_checkout_archive_checkout_time (checkout_time),
+    INDEX idx_checkout_archive_department (Department, checkout_time)
+);
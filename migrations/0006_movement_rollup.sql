@@ -0,0 +1,15 @@
+-- Precomputed time-away statistics behind /analytics, keyed by the day a
+-- movement started. Each completed movement adds to three rows: its employee,
+-- its department (Employee_no '*') and the whole company (Department '*',
+-- Employee_no '*'). refresh_movement_rollup() rebuilds recent days from checkout.
+CREATE TABLE IF NOT EXISTS movement_rollup (
+    day DATE NOT NULL,
+    Department VARCHAR(50) NOT NULL,
+    Employee_no VARCHAR(20) NOT NULL,
+    movements INT UNSIGNED NOT NULL DEFAULT 0,
+    total_seconds BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    max_seconds INT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (day, Department, Employee_no),
+    INDEX idx_movement_rollup_employee (Employee_no, day)
+);
@@ -0,0 +1,22 @@
+import os
+import time
+import signal
+import logging
+
+# Dedicated process for the background jobs. Run the web workers with
+# SCHEDULER_MODE=off so only processes started from here take part in the
+# leader election; starting two of these gives a hot standby.
+from app import create_app, start_scheduler
+
+def shutdown(signum, frame):
+    logging.info(f"Scheduler process stopping (signal {signum})")
+    raise SystemExit(0)
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    create_app({'SCHEDULER_MODE': 'leader'})
+    start_scheduler()
+    logging.info(f"Scheduler process started (pid {os.getpid()})")
+    while True:
+        time.sleep(60)